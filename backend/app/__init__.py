@@ -4,6 +4,7 @@ from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 from flask_cors import CORS
 from dotenv import load_dotenv
+import logging
 import os
 
 # Load environment variables
@@ -15,13 +16,42 @@ jwt = JWTManager()
 mail = Mail()
 cors = CORS()
 
+logger = logging.getLogger(__name__)
+
 def create_app():
     app = Flask(__name__)
     
+    # Logging: json or text lines, LOG_LEVELS overrides single loggers (e.g. "app.routes=DEBUG,pymongo=WARNING")
+    app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO')
+    app.config['LOG_LEVELS'] = os.getenv('LOG_LEVELS', '')
+    app.config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'json')
+    from app.logs import logs
+    logs.init_app(app)
+    
     # Configuration
     app.config['MONGO_URI'] = os.getenv('MONGO_URI', 'mongodb://localhost:27017/oddu_app')
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config['MONGO_ENSURE_INDEXES'] = os.getenv('MONGO_ENSURE_INDEXES', 'True').lower() == 'true'
+    
+    # Seconds a user's token version is cached per process before revocations are rechecked
+    app.config['TOKEN_VERSION_CACHE_TTL'] = int(os.getenv('TOKEN_VERSION_CACHE_TTL', 10))
+    
+    # Seconds to cache the signed-in user per process for tokens without claims (0 disables the cache)
+    app.config['CURRENT_USER_CACHE_TTL'] = int(os.getenv('CURRENT_USER_CACHE_TTL', 0))
+    
+    # Seconds a cached approval chain is trusted before its version stamp is rechecked
+    app.config['APPROVAL_CHAIN_CACHE_TTL'] = int(os.getenv('APPROVAL_CHAIN_CACHE_TTL', 5))
+    
+    # Password hashing: bcrypt or pbkdf2, cost 0 uses the scheme default, workers 0 hashes inline
+    app.config['PASSWORD_HASH_SCHEME'] = os.getenv('PASSWORD_HASH_SCHEME', 'bcrypt')
+    app.config['PASSWORD_HASH_COST'] = int(os.getenv('PASSWORD_HASH_COST', 0))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    
+    # Dated exchange rates used to convert expenses into the company currency
+    app.config['EXCHANGE_RATES_FILE'] = os.getenv(
+        'EXCHANGE_RATES_FILE', os.path.join(os.path.dirname(__file__), 'data', 'exchange_rates.json')
+    )
     
     # Email configuration
     app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
@@ -31,8 +61,30 @@ def create_app():
     app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
     app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
     
+    # Mail outbox: background sender threads (0 leaves messages queued), retry backoff in seconds
+    app.config['MAIL_OUTBOX_WORKERS'] = int(os.getenv('MAIL_OUTBOX_WORKERS', 2))
+    app.config['MAIL_OUTBOX_MAX_ATTEMPTS'] = int(os.getenv('MAIL_OUTBOX_MAX_ATTEMPTS', 6))
+    app.config['MAIL_OUTBOX_RETRY_BASE'] = int(os.getenv('MAIL_OUTBOX_RETRY_BASE', 30))
+    
+    # Request and MongoDB command metrics; /metrics is served only when METRICS_TOKEN is set
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+    from app.metrics import metrics
+    metrics.init_app(app)
+    
+    # MongoDB commands slower than this many ms are logged with their explain plan (0 disables)
+    app.config['SLOW_QUERY_MS'] = int(os.getenv('SLOW_QUERY_MS', 100))
+    app.config['SLOW_QUERY_SAMPLE_RATE'] = float(os.getenv('SLOW_QUERY_SAMPLE_RATE', 1.0))
+    from app.slow_queries import slow_queries
+    slow_queries.init_app(app)
+    
     # Initialize extensions with app
-    mongo.init_app(app)
+    event_listeners = []
+    if app.config['METRICS_ENABLED']:
+        event_listeners.append(metrics.command_listener)
+    if slow_queries.enabled:
+        event_listeners.append(slow_queries.listener)
+    mongo.init_app(app, event_listeners=event_listeners)
     jwt.init_app(app)
     mail.init_app(app)
     cors.init_app(app, 
@@ -51,6 +103,28 @@ def create_app():
     app.register_blueprint(expenses_bp, url_prefix='/expenses')
     app.register_blueprint(admin_bp, url_prefix='/admin')
     
+    # Password hashing process pool (started on first use)
+    from app.hashing import hasher
+    hasher.init_app(app)
+    
+    # Background delivery of queued mail (started on the first request or enqueued message)
+    from app.outbox import outbox
+    outbox.init_app(app)
+    
+    # Register CLI commands
+    from app.cli import db_cli
+    app.cli.add_command(db_cli)
+    
+    # Reconcile the index registry so every hot query is an index scan
+    if app.config['MONGO_ENSURE_INDEXES']:
+        from pymongo.errors import PyMongoError
+        from app.indexes import ensure_indexes
+        try:
+            with app.app_context():
+                ensure_indexes(mongo.db)
+        except PyMongoError as e:
+            logger.warning("Could not ensure MongoDB indexes: %s", e)
+    
     @app.route('/')
     def health_check():
         return {'message': 'Oddu API is running'}, 200
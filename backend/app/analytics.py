@@ -0,0 +1,181 @@
+from datetime import datetime, time
+from pymongo import UpdateOne
+from app import mongo
+from app.caching import scan_without_writes
+from app.currency import company_amount
+
+# Daily spend buckets kept in the expense_daily collection, one document per
+#   (company_id, day, category, user_id):
+#   {count, total_amount, by_status: {<status>: {count, total_amount}}, updated_at}
+# day is the expense_date truncated to midnight; amounts are in company
+# currency. Expense write paths move expenses between buckets with $inc, so
+# trend queries merge a few buckets per day instead of scanning expenses.
+
+# Expenses accumulated per bulk write when rebuilding buckets
+REBUILD_BATCH_SIZE = 1000
+
+# $dateToString formats for each supported granularity
+PERIOD_FORMATS = {
+    'day': '%Y-%m-%d',
+    'week': '%G-W%V',
+    'month': '%Y-%m'
+}
+
+# Bucket fields each group_by option merges on
+GROUP_FIELDS = {
+    'none': None,
+    'category': '$category',
+    'user': '$user_id'
+}
+
+
+def _day(value):
+    if isinstance(value, datetime):
+        return datetime.combine(value.date(), time.min)
+    if isinstance(value, str) and value:
+        return datetime.strptime(value[:10], '%Y-%m-%d')
+    return datetime.combine(datetime.utcnow().date(), time.min)
+
+
+def _bucket_key(company_id, expense):
+    return (company_id, _day(expense.get('expense_date')), expense.get('category'), expense.get('user_id'))
+
+
+def _accumulate(buckets, company_id, expense, sign):
+    key = _bucket_key(company_id, expense)
+    amount = company_amount(expense, company_id) * sign
+    status = expense.get('status')
+    inc = buckets.setdefault(key, {})
+    for field, delta in (
+        ('count', sign),
+        ('total_amount', amount),
+        (f'by_status.{status}.count', sign),
+        (f'by_status.{status}.total_amount', amount)
+    ):
+        inc[field] = inc.get(field, 0) + delta
+
+
+def _write_buckets(buckets, upsert=True):
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {'company_id': company_id, 'day': day, 'category': category, 'user_id': user_id},
+            {'$inc': inc, '$set': {'updated_at': now}},
+            upsert=upsert
+        )
+        for (company_id, day, category, user_id), inc in buckets.items()
+        if any(inc.values())
+    ]
+    if operations:
+        mongo.db.expense_daily.bulk_write(operations, ordered=False)
+
+
+def record_bucket_changes(company_id, removed=(), added=()):
+    """Move expenses out of and into their daily buckets in one bulk write.
+
+    ``removed`` and ``added`` are expense documents as they were before and
+    after a write: a new expense is only added, a deleted one only removed,
+    and a status change or edit removes the old version and adds the new one.
+    """
+    buckets = {}
+    for expense in removed:
+        _accumulate(buckets, company_id, expense, -1)
+    for expense in added:
+        _accumulate(buckets, company_id, expense, 1)
+    _write_buckets(buckets)
+
+
+def _bucket_fields(bucket):
+    # A stored bucket as the flat $inc fields _accumulate produces
+    fields = {'count': bucket.get('count', 0), 'total_amount': bucket.get('total_amount', 0)}
+    for status, values in (bucket.get('by_status') or {}).items():
+        fields[f'by_status.{status}.count'] = values.get('count', 0)
+        fields[f'by_status.{status}.total_amount'] = values.get('total_amount', 0)
+    return fields
+
+
+def rebuild_company_buckets(company_id):
+    """Recompute a company's daily buckets from its expenses; returns the bucket count.
+
+    Buckets are corrected in place rather than deleted and rewritten: each
+    one gets an ``$inc`` of the difference between the recomputed values and
+    those read with the scan, so expense writes after the scan are not lost.
+    A scan that an expense write overlapped could count that write both in
+    the scan and in its own ``$inc``, so it is retried (see
+    ``scan_without_writes``); ``RebuildConflict`` is raised if writes never
+    pause.
+    """
+    def scan():
+        before = {
+            (company_id, bucket['day'], bucket.get('category'), bucket.get('user_id')): _bucket_fields(bucket)
+            for bucket in mongo.db.expense_daily.find({'company_id': company_id})
+        }
+        cursor = mongo.db.expenses.find(
+            {'company_id': company_id},
+            {'expense_date': 1, 'category': 1, 'user_id': 1, 'status': 1,
+             'amount': 1, 'currency': 1, 'amount_company': 1}
+        ).batch_size(REBUILD_BATCH_SIZE)
+        buckets = {}
+        for expense in cursor:
+            _accumulate(buckets, company_id, expense, 1)
+        return before, buckets
+
+    before, buckets = scan_without_writes('expenses', company_id, scan)
+
+    deltas = {}
+    for key in set(buckets) | set(before):
+        new_fields, old_fields = buckets.get(key, {}), before.get(key, {})
+        deltas[key] = {
+            field: new_fields.get(field, 0) - old_fields.get(field, 0)
+            for field in set(new_fields) | set(old_fields)
+        }
+    _write_buckets(deltas)
+
+    # Buckets whose expenses have all gone
+    mongo.db.expense_daily.delete_many({'company_id': company_id, 'count': {'$lte': 0}})
+    return len(buckets)
+
+
+def rebuild_all_buckets():
+    """Rebuild the buckets for every company; returns the number of companies."""
+    company_ids = mongo.db.companies.distinct('_id')
+    for company_id in company_ids:
+        rebuild_company_buckets(company_id)
+    return len(company_ids)
+
+
+def spend_series(company_id, start, end, granularity='month', group_by='none', status=None):
+    """Spend per period between ``start`` (inclusive) and ``end`` (exclusive).
+
+    Buckets are merged per ``granularity`` period and, optionally, per
+    category or user. With ``status`` only expenses in that status count.
+    Returns rows of ``{period, key, count, total_amount}`` sorted by period.
+    """
+    if status:
+        count_field = {'$ifNull': [f'$by_status.{status}.count', 0]}
+        amount_field = {'$ifNull': [f'$by_status.{status}.total_amount', 0]}
+    else:
+        count_field, amount_field = '$count', '$total_amount'
+
+    pipeline = [
+        {'$match': {'company_id': company_id, 'day': {'$gte': start, '$lt': end}}},
+        {'$group': {
+            '_id': {
+                'period': {'$dateToString': {'format': PERIOD_FORMATS[granularity], 'date': '$day'}},
+                'key': GROUP_FIELDS[group_by]
+            },
+            'count': {'$sum': count_field},
+            'total_amount': {'$sum': amount_field}
+        }},
+        {'$match': {'count': {'$gt': 0}}},
+        {'$sort': {'_id.period': 1, 'total_amount': -1}}
+    ]
+    return [
+        {
+            'period': row['_id']['period'],
+            'key': row['_id'].get('key'),
+            'count': row['count'],
+            'total_amount': round(row['total_amount'], 2)
+        }
+        for row in mongo.db.expense_daily.aggregate(pipeline)
+    ]
@@ -0,0 +1,59 @@
+import time
+from flask import current_app
+from app import mongo
+
+# company_id -> (checked_at, version, approvers sorted by order)
+_chain_cache = {}
+
+
+def _order_key(approver):
+    return approver.get('order', 0)
+
+
+def sort_approvers(approvers):
+    """Return approvers sorted by their ``order`` field."""
+    return sorted(approvers, key=_order_key)
+
+
+def get_approval_chain(company_id):
+    """Return the company's approvers, sorted by ``order``, from a per-process cache.
+
+    A cached chain is trusted for ``APPROVAL_CHAIN_CACHE_TTL`` seconds. After
+    that, the chain's version stamp is compared with a covered index query and
+    the approvers are only re-read when another process has changed them, so
+    every worker picks up a new chain within the TTL. ``set_approval_chain``
+    invalidates this process's entry immediately.
+    """
+    ttl = current_app.config.get('APPROVAL_CHAIN_CACHE_TTL', 0)
+    now = time.monotonic()
+    entry = _chain_cache.get(company_id)
+
+    if entry:
+        checked_at, version, approvers = entry
+        if now - checked_at < ttl:
+            return approvers
+
+        stamp = mongo.db.approval_chains.find_one(
+            {'company_id': company_id},
+            {'_id': 0, 'company_id': 1, 'version': 1}
+        )
+        if stamp and stamp.get('version') == version:
+            _chain_cache[company_id] = (now, version, approvers)
+            return approvers
+
+    chain = mongo.db.approval_chains.find_one(
+        {'company_id': company_id},
+        {'approvers': 1, 'version': 1}
+    )
+    if chain:
+        approvers = sort_approvers(chain.get('approvers') or [])
+        version = chain.get('version')
+    else:
+        approvers, version = [], None
+
+    _chain_cache[company_id] = (now, version, approvers)
+    return approvers
+
+
+def invalidate_approval_chain(company_id):
+    _chain_cache.pop(company_id, None)
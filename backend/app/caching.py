@@ -0,0 +1,128 @@
+import hashlib
+import json
+import time
+from datetime import datetime
+from functools import wraps
+from flask import Response, current_app, g, request
+from app import mongo
+
+# Browsers must revalidate every time, but may reuse the body on a 304
+CACHE_CONTROL = 'private, no-cache'
+
+# Longest a write path takes from its write, through bump_collection_version,
+# to its last rollup $inc
+WRITE_SETTLE_SECONDS = 0.5
+
+# Scans a rebuild makes before giving up on a collection that keeps changing
+REBUILD_ATTEMPTS = 5
+
+
+def _digest(*parts):
+    raw = json.dumps(parts, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()[:20]
+
+
+def bump_collection_version(collection, company_id):
+    """Record a write to ``collection`` for a company, invalidating list ETags."""
+    mongo.db.collection_versions.update_one(
+        {'_id': f'{collection}:{company_id}'},
+        {'$inc': {'version': 1}, '$set': {'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def get_collection_version(collection, company_id):
+    """Return ``(version, updated_at)`` for a company's collection."""
+    doc = mongo.db.collection_versions.find_one({'_id': f'{collection}:{company_id}'})
+    if not doc:
+        return 0, None
+    return doc['version'], doc.get('updated_at')
+
+
+class RebuildConflict(Exception):
+    """The collection was written to during every attempt of a rebuild."""
+
+
+def scan_without_writes(collection, company_id, scan):
+    """Run ``scan()`` until no write to ``collection`` overlaps it; return its result.
+
+    Write paths change a document, bump the collection version, then
+    ``$inc`` their rollups, so a rollup read inside ``scan`` can only
+    disagree with the documents it scans if the version moves. The scan
+    starts once the last bump is ``WRITE_SETTLE_SECONDS`` old and is
+    accepted if the version is unchanged that long after it ends; otherwise
+    it is retried, up to ``REBUILD_ATTEMPTS`` times.
+    """
+    for _ in range(REBUILD_ATTEMPTS):
+        version, updated_at = get_collection_version(collection, company_id)
+        if updated_at:
+            age = (datetime.utcnow() - updated_at).total_seconds()
+            if age < WRITE_SETTLE_SECONDS:
+                # Let the $incs of that write land before the rollup is read
+                time.sleep(WRITE_SETTLE_SECONDS - age)
+        result = scan()
+        # Writes that changed documents before the scan ended have bumped by now
+        time.sleep(WRITE_SETTLE_SECONDS)
+        if get_collection_version(collection, company_id)[0] == version:
+            return result
+    raise RebuildConflict(f'{collection} kept changing during the rebuild; try again later')
+
+
+def _not_modified(etag, last_modified=None):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
+def _with_validators(rv, etag, last_modified=None):
+    response = current_app.make_response(rv)
+    if response.status_code == 200:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        if last_modified:
+            response.last_modified = last_modified
+    return response
+
+
+def static_etag(*payload):
+    """ETag a route whose response is built from module constants.
+
+    The tag is computed once at import, so a matching ``If-None-Match``
+    is answered with a 304 without running the view.
+    """
+    etag = _digest(*payload)
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.if_none_match.contains(etag):
+                return _not_modified(etag)
+            return _with_validators(fn(*args, **kwargs), etag)
+        return wrapper
+    return decorator
+
+
+def versioned_etag(collection):
+    """ETag a per-user list view from the company's collection version.
+
+    Must be applied under ``user_required``. The tag combines the version
+    counter, the user and the query string, so a matching ``If-None-Match``
+    costs one point read on the counter and returns a 304 without querying
+    ``collection`` itself. Writes call ``bump_collection_version``.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            current_user = g.current_user
+            version, updated_at = get_collection_version(collection, current_user['company_id'])
+            etag = _digest(collection, version, current_user['_id'], request.path,
+                           sorted(request.args.items(multi=True)))
+
+            if request.if_none_match.contains(etag):
+                return _not_modified(etag, updated_at)
+            return _with_validators(fn(*args, **kwargs), etag, updated_at)
+        return wrapper
+    return decorator
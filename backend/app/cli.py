@@ -0,0 +1,91 @@
+import click
+from bson import ObjectId
+from flask.cli import AppGroup
+from app import mongo
+from app.analytics import rebuild_all_buckets, rebuild_company_buckets
+from app.caching import RebuildConflict
+from app.currency import backfill_company_amounts
+from app.indexes import ensure_indexes
+from app.org import rebuild_all_trees, rebuild_company_tree
+from app.stats import rebuild_all_stats, rebuild_company_stats
+
+db_cli = AppGroup('db', help='Database maintenance commands.')
+
+
+@db_cli.command('ensure-indexes')
+@click.option('--dry-run', is_flag=True, help='Only report, do not create indexes.')
+@click.option('--drop-extra', is_flag=True, help='Drop indexes that are not in the registry.')
+def ensure_indexes_command(dry_run, drop_extra):
+    """Create missing indexes and report missing or extra ones."""
+    report = ensure_indexes(mongo.db, dry_run=dry_run, drop_extra=drop_extra)
+
+    for collection_name, result in report.items():
+        click.echo(f"{collection_name}:")
+        missing_label = 'missing' if dry_run else 'created'
+        click.echo(f"  {missing_label}: {', '.join(result['missing']) or '-'}")
+        click.echo(f"  changed: {', '.join(result['changed']) or '-'}")
+        extra_label = 'dropped' if drop_extra and not dry_run else 'extra'
+        click.echo(f"  {extra_label}: {', '.join(result['extra']) or '-'}")
+
+
+@db_cli.command('rebuild-stats')
+@click.option('--company-id', default=None, help='Only rebuild this company.')
+def rebuild_stats_command(company_id):
+    """Recompute the expense stats rollup from the expenses collection."""
+    try:
+        if company_id:
+            rebuild_company_stats(ObjectId(company_id))
+            click.echo(f"Rebuilt expense stats for company {company_id}")
+        else:
+            count = rebuild_all_stats()
+            click.echo(f"Rebuilt expense stats for {count} companies")
+    except RebuildConflict as e:
+        raise click.ClickException(str(e))
+
+
+@db_cli.command('backfill-amounts')
+@click.option('--company-id', default=None, help='Only backfill this company.')
+def backfill_amounts_command(company_id):
+    """Store company-currency amounts on older expenses and rebuild their stats."""
+    company_ids = [ObjectId(company_id)] if company_id else mongo.db.companies.distinct('_id')
+    for cid in company_ids:
+        updated = backfill_company_amounts(cid)
+        rebuild_company_stats(cid)
+        click.echo(f"Company {cid}: converted {updated} expenses")
+
+
+@db_cli.command('rebuild-buckets')
+@click.option('--company-id', default=None, help='Only rebuild this company.')
+def rebuild_buckets_command(company_id):
+    """Recompute the daily spend buckets from the expenses collection."""
+    try:
+        if company_id:
+            count = rebuild_company_buckets(ObjectId(company_id))
+            click.echo(f"Rebuilt {count} daily buckets for company {company_id}")
+        else:
+            count = rebuild_all_buckets()
+            click.echo(f"Rebuilt daily buckets for {count} companies")
+    except RebuildConflict as e:
+        raise click.ClickException(str(e))
+
+
+@db_cli.command('rebuild-org')
+@click.option('--company-id', default=None, help='Only rebuild this company.')
+def rebuild_org_command(company_id):
+    """Recompute each user's ancestors from manager_id."""
+    if company_id:
+        count = rebuild_company_tree(ObjectId(company_id))
+        click.echo(f"Rebuilt reporting tree for {count} users in company {company_id}")
+    else:
+        count = rebuild_all_trees()
+        click.echo(f"Rebuilt reporting trees for {count} companies")
+
+
+@db_cli.command('backfill-user-search')
+def backfill_user_search_command():
+    """Store name_lower and email_lower on users created before they existed."""
+    result = mongo.db.users.update_many(
+        {'$or': [{'name_lower': None}, {'email_lower': None}]},
+        [{'$set': {'name_lower': {'$toLower': '$name'}, 'email_lower': {'$toLower': '$email'}}}]
+    )
+    click.echo(f"Updated {result.modified_count} users")
@@ -0,0 +1,190 @@
+import bisect
+import json
+import threading
+from datetime import date, datetime
+import numpy as np
+from flask import current_app
+from pymongo import UpdateOne
+from app import mongo
+
+# Exchange rates are read from a local JSON file (EXCHANGE_RATES_FILE):
+#   {"base": "USD", "rates": [{"date": "2024-01-01", "rates": {"EUR": 0.905, ...}}, ...]}
+# Each rate is units of the currency per one unit of the base currency and
+# applies from its date until the next entry for that currency.
+
+# Expenses converted and written per round trip by backfill_company_amounts
+BACKFILL_BATCH_SIZE = 1000
+
+_table = None
+_table_path = None
+_table_lock = threading.Lock()
+
+# company_id -> currency code; no route changes a company's currency once set
+_company_currencies = {}
+
+
+def _ordinal(value):
+    """Day number of an expense date stored as a datetime, date or ISO string."""
+    if isinstance(value, (datetime, date)):
+        return value.toordinal()
+    if isinstance(value, str) and value:
+        return date.fromisoformat(value[:10]).toordinal()
+    return date.today().toordinal()
+
+
+class RateTable:
+    """Dated exchange rates indexed per currency.
+
+    Each currency keeps its effective dates (as day ordinals) and rates in
+    parallel sorted arrays, so a single lookup is a bisect and a column of
+    lookups is one ``np.searchsorted`` per currency.
+    """
+
+    def __init__(self, base, entries):
+        self.base = base
+        series = {}
+        for entry in sorted(entries, key=lambda entry: entry['date']):
+            day = date.fromisoformat(entry['date']).toordinal()
+            for code, rate in entry['rates'].items():
+                series.setdefault(code, ([], []))
+                series[code][0].append(day)
+                series[code][1].append(float(rate))
+        series.setdefault(base, ([date.min.toordinal()], [1.0]))
+
+        self._days = {code: days for code, (days, _) in series.items()}
+        self._day_arrays = {code: np.array(days, dtype=np.int64) for code, (days, _) in series.items()}
+        self._rate_arrays = {code: np.array(rates, dtype=np.float64) for code, (_, rates) in series.items()}
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['base'], data['rates'])
+
+    @property
+    def currencies(self):
+        return sorted(self._days)
+
+    def _series(self, currency):
+        if currency not in self._days:
+            raise ValueError(f'No exchange rates for {currency}')
+        return self._days[currency], self._rate_arrays[currency]
+
+    def rate(self, currency, on):
+        """Units of ``currency`` per base unit on the given date.
+
+        Dates before the first entry use the earliest known rate.
+        """
+        days, rates = self._series(currency)
+        index = max(bisect.bisect_right(days, _ordinal(on)) - 1, 0)
+        return float(rates[index])
+
+    def convert(self, amount, from_currency, to_currency, on):
+        if from_currency == to_currency:
+            return round(float(amount), 2)
+        converted = amount / self.rate(from_currency, on) * self.rate(to_currency, on)
+        return round(float(converted), 2)
+
+    def _rates_for(self, currency, ordinals):
+        self._series(currency)
+        indexes = np.searchsorted(self._day_arrays[currency], ordinals, side='right') - 1
+        return self._rate_arrays[currency][np.clip(indexes, 0, None)]
+
+    def convert_many(self, amounts, currencies, dates, to_currency):
+        """Convert whole columns of amounts into ``to_currency``.
+
+        ``amounts``, ``currencies`` and ``dates`` are parallel sequences.
+        Returns a float64 array rounded to cents.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        if amounts.size == 0:
+            return amounts
+        ordinals = np.fromiter((_ordinal(value) for value in dates), dtype=np.int64, count=amounts.size)
+        codes, inverse = np.unique(np.asarray(currencies, dtype=object).astype(str), return_inverse=True)
+
+        from_rates = np.empty(amounts.size, dtype=np.float64)
+        for position, code in enumerate(codes):
+            mask = inverse == position
+            from_rates[mask] = self._rates_for(code, ordinals[mask])
+
+        to_rates = self._rates_for(to_currency, ordinals)
+        return np.round(amounts / from_rates * to_rates, 2)
+
+
+def get_rate_table():
+    """Return the rate table for ``EXCHANGE_RATES_FILE``, loading it once per process."""
+    global _table, _table_path
+    path = current_app.config['EXCHANGE_RATES_FILE']
+    if _table is None or _table_path != path:
+        with _table_lock:
+            if _table is None or _table_path != path:
+                _table = RateTable.load(path)
+                _table_path = path
+    return _table
+
+
+def get_company_currency(company_id):
+    currency = _company_currencies.get(company_id)
+    if currency is None:
+        company = mongo.db.companies.find_one({'_id': company_id}, {'currency': 1})
+        currency = (company or {}).get('currency') or 'USD'
+        _company_currencies[company_id] = currency
+    return currency
+
+
+def to_company_currency(company_id, amount, currency, expense_date):
+    """Convert one amount into the company's reporting currency."""
+    return get_rate_table().convert(amount, currency, get_company_currency(company_id), expense_date)
+
+
+def company_amount(expense, company_id):
+    """The expense amount in company currency, converting older expenses that lack it."""
+    if expense.get('amount_company') is not None:
+        return expense['amount_company']
+    return to_company_currency(company_id, expense['amount'], expense['currency'], expense.get('expense_date'))
+
+
+def convert_expenses(company_id, expenses):
+    """Company-currency amounts for a list of expense documents, as one array."""
+    return get_rate_table().convert_many(
+        [expense['amount'] for expense in expenses],
+        [expense.get('currency') or 'USD' for expense in expenses],
+        [expense.get('expense_date') for expense in expenses],
+        get_company_currency(company_id)
+    )
+
+
+def backfill_company_amounts(company_id):
+    """Store ``amount_company`` on a company's expenses that predate it.
+
+    Returns the number of expenses updated.
+    """
+    company_currency = get_company_currency(company_id)
+    cursor = mongo.db.expenses.find(
+        # None matches both a missing field and an explicit null
+        {'company_id': company_id, 'amount_company': None},
+        {'amount': 1, 'currency': 1, 'expense_date': 1}
+    ).batch_size(BACKFILL_BATCH_SIZE)
+
+    updated = 0
+    batch = []
+    for expense in cursor:
+        batch.append(expense)
+        if len(batch) == BACKFILL_BATCH_SIZE:
+            updated += _write_company_amounts(company_id, company_currency, batch)
+            batch = []
+    if batch:
+        updated += _write_company_amounts(company_id, company_currency, batch)
+    return updated
+
+
+def _write_company_amounts(company_id, company_currency, expenses):
+    amounts = convert_expenses(company_id, expenses)
+    operations = [
+        UpdateOne(
+            {'_id': expense['_id'], 'amount_company': None},
+            {'$set': {'amount_company': float(amount), 'company_currency': company_currency}}
+        )
+        for expense, amount in zip(expenses, amounts)
+    ]
+    return mongo.db.expenses.bulk_write(operations, ordered=False).modified_count
@@ -0,0 +1,163 @@
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, jsonify
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt, get_jwt_identity
+from bson import ObjectId
+from app import mongo, jwt
+
+# Fields loaded for tokens issued before claims were added; password_hash is never loaded here
+CURRENT_USER_PROJECTION = {'name': 1, 'email': 1, 'role': 1, 'company_id': 1, 'manager_id': 1}
+
+# Upper bound on cached token versions per process
+TOKEN_VERSION_CACHE_MAX_SIZE = 10000
+
+# Upper bound on cached identities per process
+IDENTITY_CACHE_MAX_SIZE = 10000
+
+# user_id -> (expires_at, token_version)
+_token_version_cache = {}
+_token_version_cache_lock = threading.Lock()
+
+# user_id -> (expires_at, user), for tokens issued before claims were added
+_identity_cache = {}
+_identity_cache_lock = threading.Lock()
+
+
+def create_user_token(user):
+    """Issue an access token carrying the claims routes authorize from.
+
+    ``tv`` is the user's ``token_version``; bumping it in the database
+    revokes every token issued before, so role, company and manager claims
+    can never outlive a change to them.
+    """
+    manager_id = user.get('manager_id')
+    return create_access_token(
+        identity=str(user['_id']),
+        additional_claims={
+            'role': user['role'],
+            'company_id': str(user['company_id']),
+            'manager_id': str(manager_id) if manager_id else None,
+            'tv': user.get('token_version', 0)
+        }
+    )
+
+
+def _cache_token_version(user_id, version, ttl):
+    now = time.monotonic()
+    with _token_version_cache_lock:
+        if len(_token_version_cache) >= TOKEN_VERSION_CACHE_MAX_SIZE:
+            for key in [key for key, entry in _token_version_cache.items() if entry[0] <= now]:
+                del _token_version_cache[key]
+            if len(_token_version_cache) >= TOKEN_VERSION_CACHE_MAX_SIZE:
+                _token_version_cache.clear()
+        _token_version_cache[user_id] = (now + ttl, version)
+
+
+def get_token_version(user_id):
+    """Return the user's current token version, or None if the user is gone.
+
+    Versions are cached per process for ``TOKEN_VERSION_CACHE_TTL`` seconds,
+    so other processes honour a revocation within that window.
+    """
+    ttl = current_app.config.get('TOKEN_VERSION_CACHE_TTL', 0)
+    entry = _token_version_cache.get(user_id)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+
+    user = mongo.db.users.find_one({'_id': ObjectId(user_id)}, {'_id': 0, 'token_version': 1})
+    version = user.get('token_version', 0) if user is not None else None
+    if ttl > 0:
+        _cache_token_version(user_id, version, ttl)
+    return version
+
+
+def _cached_identity(user_id):
+    entry = _identity_cache.get(user_id)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+
+def _cache_identity(user_id, user, ttl):
+    now = time.monotonic()
+    with _identity_cache_lock:
+        if len(_identity_cache) >= IDENTITY_CACHE_MAX_SIZE:
+            for key in [key for key, entry in _identity_cache.items() if entry[0] <= now]:
+                del _identity_cache[key]
+            if len(_identity_cache) >= IDENTITY_CACHE_MAX_SIZE:
+                _identity_cache.clear()
+        _identity_cache[user_id] = (now + ttl, user)
+
+
+def invalidate_token_version(user_id):
+    """Drop a user's cached token version and identity after bumping ``token_version``."""
+    with _token_version_cache_lock:
+        _token_version_cache.pop(str(user_id), None)
+    with _identity_cache_lock:
+        _identity_cache.pop(str(user_id), None)
+
+
+@jwt.token_in_blocklist_loader
+def is_token_revoked(jwt_header, jwt_payload):
+    # Tokens issued before claims were added carry no version; the user is loaded instead
+    if 'tv' not in jwt_payload:
+        return False
+    return get_token_version(jwt_payload['sub']) != jwt_payload['tv']
+
+
+def load_current_user():
+    """Return the signed-in user, built from the token claims.
+
+    Only tokens without claims fall back to reading the user document, which
+    with ``CURRENT_USER_CACHE_TTL`` > 0 is kept in a per-process cache for
+    that many seconds.
+    """
+    if 'current_user' in g:
+        return g.current_user
+
+    claims = get_jwt()
+    if 'tv' in claims:
+        user = {
+            '_id': ObjectId(get_jwt_identity()),
+            'role': claims['role'],
+            'company_id': ObjectId(claims['company_id']),
+            'manager_id': ObjectId(claims['manager_id']) if claims.get('manager_id') else None
+        }
+    else:
+        user_id = get_jwt_identity()
+        ttl = current_app.config.get('CURRENT_USER_CACHE_TTL', 0)
+        user = _cached_identity(user_id) if ttl > 0 else None
+        if user is None:
+            user = mongo.db.users.find_one({'_id': ObjectId(user_id)}, CURRENT_USER_PROJECTION)
+            if user and ttl > 0:
+                _cache_identity(user_id, user, ttl)
+
+    g.current_user = dict(user) if user else None
+    return g.current_user
+
+
+def user_required(roles=None, message='Access denied'):
+    """Require a valid JWT and load the signed-in user into ``g.current_user``.
+
+    Responds 404 when the user no longer exists and 403 with ``message`` when
+    ``roles`` is given and the user's role is not one of them.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        @jwt_required()
+        def wrapper(*args, **kwargs):
+            try:
+                current_user = load_current_user()
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+
+            if not current_user:
+                return jsonify({'error': 'User not found'}), 404
+
+            if roles and current_user['role'] not in roles:
+                return jsonify({'error': message}), 403
+
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,183 @@
+import json
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from app.caching import get_collection_version
+
+# List filters accepted by the expense list endpoints. Every filter turns into
+# an equality, $in or range predicate on a plain field (never a regex or
+# $where), so the planner can use the company_id-prefixed indexes.
+
+# Query parameter -> expense field, for filters that take one or more values
+# (comma separated); a single value becomes an equality match, several an $in
+VALUE_FILTERS = {
+    'status': 'status',
+    'category': 'category',
+    'currency': 'currency'
+}
+
+# Query parameter -> expense field, for filters that take one user id
+ID_FILTERS = {
+    'employee_id': 'user_id',
+    'approver_id': 'approver_id'
+}
+
+# Fields the response reports facet counts for
+FACET_FIELDS = ('status', 'category', 'currency')
+
+# Most values accepted in one comma-separated filter
+MAX_FILTER_VALUES = 50
+
+# Facet results kept per process, keyed by collection version, scope and filters
+FACET_CACHE_SIZE = 512
+
+_facet_cache = OrderedDict()
+_facet_cache_lock = threading.Lock()
+
+
+def _values(raw, name):
+    values = [value.strip() for value in raw.split(',') if value.strip()]
+    if len(values) > MAX_FILTER_VALUES:
+        raise ValueError(f'{name} accepts at most {MAX_FILTER_VALUES} values')
+    return values
+
+
+def _date(raw, name):
+    try:
+        return datetime.strptime(raw, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'{name} must use YYYY-MM-DD')
+
+
+def _amount(raw, name):
+    try:
+        value = float(raw)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+    if not math.isfinite(value):
+        raise ValueError(f'{name} must be a finite number')
+    return value
+
+
+def parse_expense_filters(args):
+    """Turn request query parameters into ``{field: predicate}``.
+
+    Supports ``status``, ``category``, ``currency`` (comma separated),
+    ``employee_id``, ``approver_id``, ``start_date``/``end_date`` (on
+    ``expense_date``, end inclusive) and ``min_amount``/``max_amount`` (on
+    ``amount_company``, so the range is in the company currency, like the
+    facet totals). Raises ValueError with a client-facing message on bad
+    input.
+    """
+    filters = {}
+
+    for param, field in VALUE_FILTERS.items():
+        if args.get(param):
+            values = _values(args[param], param)
+            if values:
+                filters[field] = values[0] if len(values) == 1 else {'$in': values}
+
+    for param, field in ID_FILTERS.items():
+        if args.get(param):
+            try:
+                filters[field] = ObjectId(args[param])
+            except (InvalidId, TypeError):
+                raise ValueError(f'Invalid {param}')
+
+    date_range = {}
+    if args.get('start_date'):
+        date_range['$gte'] = _date(args['start_date'], 'start_date')
+    if args.get('end_date'):
+        date_range['$lt'] = _date(args['end_date'], 'end_date') + timedelta(days=1)
+    if date_range:
+        filters['expense_date'] = date_range
+
+    amount_range = {}
+    if args.get('min_amount'):
+        amount_range['$gte'] = _amount(args['min_amount'], 'min_amount')
+    if args.get('max_amount'):
+        amount_range['$lte'] = _amount(args['max_amount'], 'max_amount')
+    if amount_range:
+        filters['amount_company'] = amount_range
+
+    return filters
+
+
+def apply_filters(query, filters):
+    """Return ``query`` narrowed by ``filters``.
+
+    A filter on a field the query already constrains (for example an
+    employee's own ``user_id``) is ANDed with it rather than replacing it.
+    """
+    query = dict(query)
+    for field, predicate in filters.items():
+        if field in query:
+            query.setdefault('$and', []).append({field: predicate})
+        else:
+            query[field] = predicate
+    return query
+
+
+def facet_counts(collection, scope, filters):
+    """Counts and totals per status, category and currency for the current filter.
+
+    Each facet applies every filter except its own, so a client can see how
+    many rows selecting another value would return. Totals sum
+    ``amount_company`` (company currency). All facets come from one
+    ``$facet`` aggregation over the scope and the non-facet filters.
+    """
+    facet_filters = {field: filters[field] for field in FACET_FIELDS if field in filters}
+    other_filters = {field: predicate for field, predicate in filters.items() if field not in facet_filters}
+
+    facets = {}
+    for field in FACET_FIELDS:
+        match = {other: predicate for other, predicate in facet_filters.items() if other != field}
+        facets[field] = [
+            {'$match': match},
+            {'$group': {'_id': f'${field}', 'count': {'$sum': 1}, 'total_amount': {'$sum': '$amount_company'}}},
+            {'$sort': {'count': -1, '_id': 1}}
+        ]
+
+    pipeline = [
+        {'$match': apply_filters(scope, other_filters)},
+        {'$project': {**{field: 1 for field in FACET_FIELDS}, 'amount_company': 1}},
+        {'$facet': facets}
+    ]
+    result = next(collection.aggregate(pipeline), {})
+    return {
+        field: [
+            {'value': row['_id'], 'count': row['count'], 'total_amount': round(row['total_amount'], 2)}
+            for row in result.get(field, [])
+        ]
+        for field in FACET_FIELDS
+    }
+
+
+def cached_facet_counts(collection, company_id, scope, filters):
+    """``facet_counts`` cached until the company's next write to ``collection``.
+
+    The key includes the collection version that every expense write bumps,
+    so a refresh or a return to an earlier filter costs one point read
+    instead of another aggregation over the company's expenses.
+    """
+    version, _ = get_collection_version(collection.name, company_id)
+    key = (collection.name, version, json.dumps([scope, filters], sort_keys=True, default=str))
+    with _facet_cache_lock:
+        if key in _facet_cache:
+            _facet_cache.move_to_end(key)
+            return _facet_cache[key]
+
+    facets = facet_counts(collection, scope, filters)
+    with _facet_cache_lock:
+        _facet_cache[key] = facets
+        while len(_facet_cache) > FACET_CACHE_SIZE:
+            _facet_cache.popitem(last=False)
+    return facets
+
+
+def wants_facets(args):
+    """True when the client asked for facets (``?facets=1``) on a first page."""
+    return args.get('facets', '').lower() in ('1', 'true') and not args.get('cursor')
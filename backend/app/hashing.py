@@ -0,0 +1,151 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+import bcrypt
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing runs in a process pool so the deliberately slow KDF work
+# does not hold the GIL on request threads. Supported schemes:
+#   bcrypt  cost = log2 rounds          ($2b$12$...)
+#   pbkdf2  cost = PBKDF2-SHA256 iterations (pbkdf2:sha256:600000$...)
+# Hashes from either scheme always verify; needs_rehash reports hashes that
+# do not match the configured scheme and cost so login can upgrade them.
+
+DEFAULT_COSTS = {
+    'bcrypt': 12,
+    'pbkdf2': 600000
+}
+
+
+class HashingBusy(Exception):
+    """Raised when too many hashing jobs are queued or one does not finish in time."""
+
+
+def _hash(password, scheme, cost):
+    if scheme == 'bcrypt':
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=cost)).decode('ascii')
+    return generate_password_hash(password, method=f'pbkdf2:sha256:{cost}')
+
+
+def _verify(password, password_hash):
+    if password_hash.startswith('$2'):
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('ascii'))
+    return check_password_hash(password_hash, password)
+
+
+def _scheme_of(password_hash):
+    """Return (scheme, cost) for a stored hash, or (None, None) if unknown."""
+    if password_hash.startswith('$2'):
+        # $2b$<cost>$<salt+hash>
+        return 'bcrypt', int(password_hash.split('$')[2])
+    method = password_hash.split('$', 1)[0]
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2' and len(parts) == 3 and parts[1] == 'sha256':
+        return 'pbkdf2', int(parts[2])
+    return None, None
+
+
+class PasswordHasher:
+    """Hash and verify passwords in a bounded process pool.
+
+    At most ``workers`` hashes run at once and at most ``max_pending`` jobs
+    wait behind them; further calls wait up to ``timeout`` seconds for a slot
+    and then raise ``HashingBusy``. With ``workers`` set to 0 hashing runs
+    inline on the calling thread.
+    """
+
+    def __init__(self, app=None, **options):
+        self.scheme = 'bcrypt'
+        self.cost = DEFAULT_COSTS['bcrypt']
+        self.workers = 0
+        self.timeout = 30
+        self._slots = None
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+        elif options:
+            self.configure(**options)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_SCHEME', 'bcrypt')
+        app.config.setdefault('PASSWORD_HASH_COST', 0)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 0)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 30)
+        app.extensions['password_hasher'] = self
+        self.configure(
+            scheme=app.config['PASSWORD_HASH_SCHEME'],
+            cost=app.config['PASSWORD_HASH_COST'],
+            workers=app.config['PASSWORD_HASH_WORKERS'],
+            max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+            timeout=app.config['PASSWORD_HASH_TIMEOUT']
+        )
+
+    def configure(self, scheme='bcrypt', cost=0, workers=2, max_pending=0, timeout=30):
+        """Set the scheme and pool size. A cost or max_pending of 0 picks the default."""
+        if scheme not in DEFAULT_COSTS:
+            raise ValueError(f"Unsupported password hash scheme: {scheme}")
+        self.shutdown()
+        self.scheme = scheme
+        self.cost = cost or DEFAULT_COSTS[scheme]
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + (max_pending or workers * 4)) if workers > 0 else None
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _get_executor(self):
+        # Created on first use so CLI commands and imports never start processes
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that holds MongoClient threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingBusy('Password hashing queue is full')
+        try:
+            return self._get_executor().submit(fn, *args).result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingBusy('Password hashing timed out')
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.scheme, self.cost)
+
+    def verify(self, password, password_hash):
+        if not password_hash:
+            return False
+        return self._run(_verify, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was not made with the configured scheme and cost."""
+        return _scheme_of(password_hash) != (self.scheme, self.cost)
+
+
+hasher = PasswordHasher()
+
+
+def hash_password(password):
+    return hasher.hash(password)
+
+
+def verify_password(password, password_hash):
+    return hasher.verify(password, password_hash)
+
+
+def needs_rehash(password_hash):
+    return hasher.needs_rehash(password_hash)
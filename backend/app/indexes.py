@@ -0,0 +1,134 @@
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+# Index registry: one entry per collection, each listing the indexes that the
+# route modules rely on. Every index is named so reconciliation can compare
+# what exists in the database against what is declared here.
+INDEXES = {
+    'users': [
+        # Login, signup and password reset look users up by email
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+        # /users/list filtered by role, ordered by name; its (company_id, role)
+        # prefix also serves the managers dropdown
+        IndexModel(
+            [('company_id', ASCENDING), ('role', ASCENDING), ('name', ASCENDING), ('_id', ASCENDING)],
+            name='company_role_name'
+        ),
+        # /users/list pages ordered by (name, _id)
+        IndexModel([('company_id', ASCENDING), ('name', ASCENDING), ('_id', ASCENDING)], name='company_name'),
+        # /users/list?q= anchored prefix search on name or email
+        IndexModel([('company_id', ASCENDING), ('name_lower', ASCENDING)], name='company_name_lower'),
+        IndexModel([('company_id', ASCENDING), ('email_lower', ASCENDING)], name='company_email_lower'),
+        # Transitive reports of a manager (multikey over the materialised reporting tree)
+        IndexModel([('ancestors', ASCENDING)], name='ancestors'),
+    ],
+    'expenses': [
+        # /expenses/all and admin list, paginated on (submitted_at, _id)
+        IndexModel(
+            [('company_id', ASCENDING), ('submitted_at', DESCENDING), ('_id', DESCENDING)],
+            name='company_submitted'
+        ),
+        # /expenses/all filtered by status, paginated on (submitted_at, _id)
+        IndexModel(
+            [('company_id', ASCENDING), ('status', ASCENDING), ('submitted_at', DESCENDING), ('_id', DESCENDING)],
+            name='company_status_submitted'
+        ),
+        # /expenses/my-expenses and employee list
+        IndexModel(
+            [('user_id', ASCENDING), ('submitted_at', DESCENDING), ('_id', DESCENDING)],
+            name='user_submitted'
+        ),
+        # /expenses/pending-approvals
+        IndexModel(
+            [('approver_id', ASCENDING), ('status', ASCENDING), ('submitted_at', ASCENDING)],
+            name='approver_status_submitted'
+        ),
+        # Manager list: $elemMatch on approvals.role / approvals.status (multikey)
+        IndexModel(
+            [('company_id', ASCENDING), ('approvals.role', ASCENDING), ('approvals.status', ASCENDING)],
+            name='company_approvals_role_status'
+        ),
+        # /expenses/search: company_id equality prefix keeps every search inside one company
+        IndexModel(
+            [('company_id', ASCENDING), ('description', TEXT), ('remarks', TEXT), ('category', TEXT)],
+            name='company_text',
+            weights={'description': 10, 'category': 5, 'remarks': 1},
+            default_language='english'
+        ),
+    ],
+    'expense_daily': [
+        # One bucket per (company, day, category, user); also serves date-range trend queries
+        IndexModel(
+            [('company_id', ASCENDING), ('day', ASCENDING), ('category', ASCENDING), ('user_id', ASCENDING)],
+            name='company_day_category_user',
+            unique=True
+        ),
+    ],
+    'mail_outbox': [
+        # Claim query: due pending messages, oldest first
+        IndexModel([('status', ASCENDING), ('next_attempt_at', ASCENDING)], name='status_next_attempt'),
+        # Stale 'sending' messages whose sender died
+        IndexModel([('status', ASCENDING), ('locked_until', ASCENDING)], name='status_locked_until'),
+        # Delivered messages are removed after a week
+        IndexModel([('sent_at', ASCENDING)], name='sent_at_ttl', expireAfterSeconds=7 * 24 * 3600),
+    ],
+    'approval_chains': [
+        IndexModel([('company_id', ASCENDING)], name='company_unique', unique=True),
+        # Covers the version-stamp check behind the approval-chain cache
+        IndexModel([('company_id', ASCENDING), ('version', ASCENDING)], name='company_version'),
+    ],
+}
+
+
+def _key_of(spec):
+    """Normalise an index key spec to a comparable tuple.
+
+    MongoDB reports a text index's fields as a single ``_fts``/``_ftsx``
+    pair, so declared text fields are collapsed the same way.
+    """
+    key = []
+    for field, direction in spec.items():
+        if direction == TEXT:
+            if ('_fts', TEXT) not in key:
+                key.extend([('_fts', TEXT), ('_ftsx', 1)])
+        else:
+            key.append((field, direction))
+    return tuple(key)
+
+
+def ensure_indexes(db, dry_run=False, drop_extra=False):
+    """Reconcile the database indexes against the registry.
+
+    Missing indexes are created (unless ``dry_run``), indexes whose name
+    matches but whose keys differ are reported as changed, and indexes not in
+    the registry are reported as extra and only dropped when ``drop_extra``.
+    The call is idempotent and returns a report dict per collection.
+    """
+    report = {}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        declared = {model.document['name']: model for model in models}
+
+        missing = []
+        changed = []
+        for name, model in declared.items():
+            if name not in existing:
+                missing.append(model)
+            elif _key_of(model.document['key']) != tuple(existing[name]['key']):
+                changed.append(name)
+
+        extra = [name for name in existing if name != '_id_' and name not in declared]
+
+        if not dry_run:
+            if missing:
+                collection.create_indexes(missing)
+            if drop_extra:
+                for name in extra:
+                    collection.drop_index(name)
+
+        report[collection_name] = {
+            'missing': [model.document['name'] for model in missing],
+            'changed': changed,
+            'extra': extra,
+        }
+    return report
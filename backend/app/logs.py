@@ -0,0 +1,156 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+
+# Application logging. Loggers are per module (logging.getLogger(__name__)).
+# Records pass through a QueueHandler on the calling thread, which only
+# resolves the message and the request id; a QueueListener thread does the
+# JSON formatting and the stream write. Pass arguments the %-style way
+# (logger.debug('Found %d', n)) so disabled levels never build the message,
+# and guard expensive arguments with logger.isEnabledFor(logging.DEBUG).
+
+# Records held for the listener thread; further records are dropped rather than blocking requests
+LOG_QUEUE_SIZE = 10000
+
+# Inbound X-Request-ID values accepted as the correlation id
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'
+
+# LogRecord attributes that are not caller-supplied ``extra`` fields
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def current_request_id():
+    """The id of the request being served on this thread, or None."""
+    if has_request_context():
+        return g.get('request_id')
+    return None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with any ``extra`` fields kept as keys."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'thread': record.threadName
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestQueueHandler(QueueHandler):
+    """Queue records with their request id, leaving formatting to the listener."""
+
+    def prepare(self, record):
+        # Resolve the message now: its arguments may change once the caller moves on
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_id = current_request_id()
+        if record.exc_info:
+            # Tracebacks hold frames, so they are rendered before leaving this thread
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def parse_levels(spec):
+    """``'app.routes=DEBUG,pymongo=WARNING'`` -> ``{'app.routes': 'DEBUG', 'pymongo': 'WARNING'}``."""
+    levels = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        name, _, level = item.partition('=')
+        level = level.strip().upper()
+        if not name.strip() or not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f'Invalid LOG_LEVELS entry: {item.strip()}')
+        levels[name.strip()] = level
+    return levels
+
+
+class Logs:
+    """Configure queued JSON logging and request-id correlation for the app.
+
+    Every request gets an id, taken from a well-formed ``X-Request-ID``
+    header or generated, which is added to its log records and echoed in
+    the response header.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._handler = None
+        self._listener = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('LOG_LEVEL', 'INFO')
+        app.config.setdefault('LOG_LEVELS', '')
+        app.config.setdefault('LOG_FORMAT', 'json')
+        app.extensions['logs'] = self
+        self.configure(app.config['LOG_LEVEL'], parse_levels(app.config['LOG_LEVELS']), app.config['LOG_FORMAT'])
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def configure(self, level, levels, log_format):
+        root = logging.getLogger()
+        root.setLevel(level.upper())
+        for name, logger_level in levels.items():
+            logging.getLogger(name).setLevel(logger_level)
+
+        # Installed once per process, however many apps are created
+        if self._handler is not None:
+            return
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+        self._handler = RequestQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        root.addHandler(self._handler)
+        self._listener = QueueListener(self._handler.queue, stream_handler)
+        self._listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        # Flushes records still queued
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def _before_request(self):
+        request_id = request.headers.get('X-Request-ID', '')
+        g.request_id = request_id if REQUEST_ID_PATTERN.match(request_id) else uuid.uuid4().hex
+
+    def _after_request(self, response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        return response
+
+
+logs = Logs()
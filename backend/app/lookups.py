@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from bson import ObjectId
+from app import mongo
+
+
+def get_user_map(user_ids, projection=None):
+    """Resolve a batch of user ids with a single ``$in`` query.
+
+    Accepts ObjectIds or their string form (None values are skipped) and
+    returns a dict mapping each found ``ObjectId`` to its user document.
+    """
+    ids = set()
+    for user_id in user_ids:
+        if not user_id:
+            continue
+        ids.add(user_id if isinstance(user_id, ObjectId) else ObjectId(user_id))
+
+    if not ids:
+        return {}
+
+    if projection is None:
+        projection = {'name': 1, 'email': 1}
+
+    users = mongo.db.users.find({'_id': {'$in': list(ids)}}, projection)
+    return {user['_id']: user for user in users}
+
+
+class UserNameCache:
+    """Bounded LRU cache of user id -> name for long-running streams.
+
+    Misses for a whole batch of ids are resolved with one ``$in`` query, and
+    the least recently used entries are evicted once ``maxsize`` is reached so
+    memory stays flat however many rows are streamed.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._names = OrderedDict()
+
+    def resolve(self, user_ids):
+        """Make sure every id in ``user_ids`` is cached; returns nothing."""
+        misses = set()
+        for user_id in user_ids:
+            if not user_id:
+                continue
+            if user_id in self._names:
+                self._names.move_to_end(user_id)
+            else:
+                misses.add(user_id)
+
+        if misses:
+            found = get_user_map(misses, {'name': 1})
+            for user_id in misses:
+                user = found.get(user_id)
+                self._set(user_id, user['name'] if user else 'Unknown')
+
+    def get(self, user_id, default=None):
+        return self._names.get(user_id, default)
+
+    def _set(self, user_id, name):
+        self._names[user_id] = name
+        self._names.move_to_end(user_id)
+        while len(self._names) > self.maxsize:
+            self._names.popitem(last=False)
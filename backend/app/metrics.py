@@ -0,0 +1,211 @@
+import bisect
+import hmac
+import threading
+import time
+from flask import Response, abort, g, request
+from pymongo import monitoring
+
+# In-process metrics exposed at /metrics in the Prometheus text format.
+# Observations take one short lock and a bisect over the bucket bounds, so
+# instrumentation can stay on in production. Each worker process keeps its
+# own numbers and a scrape reaches whichever process takes the request, so
+# run one worker per scrape target (or scrape each worker's own port).
+# /metrics is only served when METRICS_TOKEN is set, and requires it as a
+# bearer token.
+
+# Latency buckets in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMMAND_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Mongo commands issued while serving one request
+COMMANDS_PER_REQUEST_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# Commands whose collection is not the value of the command name field
+_COLLECTION_FIELDS = {'getMore': 'collection'}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted(
+                (label_values, (list(series[0]), series[1], series[2]))
+                for label_values, series in self._series.items()
+            )
+        bucket_labels = self.labels + ('le',)
+        for label_values, (counts, total, count) in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                labels = _format_labels(bucket_labels, label_values + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Time every MongoDB command per collection and count them per request."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        # (connection, request id) -> (command name, collection), between started and finished
+        self._inflight = {}
+
+    def started(self, event):
+        field = _COLLECTION_FIELDS.get(event.command_name, event.command_name)
+        collection = event.command.get(field)
+        if not isinstance(collection, str):
+            collection = ''
+        self._inflight[(event.connection_id, event.request_id)] = (event.command_name, collection)
+        self.metrics._count_request_command()
+
+    def _finished(self, event, outcome):
+        command_name, collection = self._inflight.pop(
+            (event.connection_id, event.request_id), (event.command_name, '')
+        )
+        self.metrics.mongo_command_seconds.observe(event.duration_micros / 1e6, collection, command_name)
+        self.metrics.mongo_commands.inc(collection, command_name, outcome)
+
+    def succeeded(self, event):
+        self._finished(event, 'success')
+
+    def failed(self, event):
+        self._finished(event, 'failure')
+
+
+class Metrics:
+    """Request and MongoDB instrumentation for the app.
+
+    ``init_app`` installs request hooks and the ``/metrics`` route; pass
+    ``command_listener`` to the MongoClient via ``event_listeners``.
+    """
+
+    def __init__(self):
+        self.http_request_seconds = Histogram(
+            'http_request_duration_seconds', 'Request latency by blueprint.',
+            REQUEST_BUCKETS, ('blueprint', 'method')
+        )
+        self.http_requests = Counter(
+            'http_requests_total', 'Responses by blueprint and status code.',
+            ('blueprint', 'method', 'status')
+        )
+        self.mongo_command_seconds = Histogram(
+            'mongodb_command_duration_seconds', 'MongoDB command latency by collection.',
+            COMMAND_BUCKETS, ('collection', 'command')
+        )
+        self.mongo_commands = Counter(
+            'mongodb_commands_total', 'MongoDB commands by collection and outcome.',
+            ('collection', 'command', 'outcome')
+        )
+        self.mongo_commands_per_request = Histogram(
+            'http_request_mongodb_commands', 'MongoDB commands issued per request.',
+            COMMANDS_PER_REQUEST_BUCKETS, ('blueprint',)
+        )
+        self.command_listener = CommandMetricsListener(self)
+        self._token = None
+        # Commands issued on this thread during the current request
+        self._local = threading.local()
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        self._token = app.config['METRICS_TOKEN']
+        if self._token:
+            app.add_url_rule('/metrics', 'metrics', self.render_response)
+
+    def _count_request_command(self):
+        # Only request threads set a counter; background threads are not attributed
+        if getattr(self._local, 'commands', None) is not None:
+            self._local.commands += 1
+
+    def _before_request(self):
+        g._metrics_started = time.perf_counter()
+        self._local.commands = 0
+
+    def _after_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            blueprint = request.blueprint or 'app'
+            self.http_request_seconds.observe(time.perf_counter() - started, blueprint, request.method)
+            self.http_requests.inc(blueprint, request.method, str(response.status_code))
+            self.mongo_commands_per_request.observe(self._local.commands or 0, blueprint)
+        return response
+
+    def _teardown_request(self, exc):
+        self._local.commands = None
+
+    def render(self):
+        lines = []
+        for metric in (self.http_request_seconds, self.http_requests, self.mongo_command_seconds,
+                       self.mongo_commands, self.mongo_commands_per_request):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def render_response(self):
+        # Same port as the public API, so every scrape must present the token
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {self._token}'.encode()):
+            abort(401)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
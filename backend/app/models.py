@@ -1,5 +1,5 @@
 from bson import ObjectId
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.hashing import hash_password, verify_password
 from datetime import datetime
 
 
@@ -20,42 +20,52 @@ class Company:
 
 
 class User:
-    def __init__(self, company_id, name, email, password, role="Employee", manager_id=None):
+    def __init__(self, company_id, name, email, password, role="Employee", manager_id=None, ancestors=None):
         self.company_id = company_id
         self.name = name
+        self.name_lower = name.lower()  # For case-insensitive prefix search
         self.email = email
-        self.password_hash = generate_password_hash(password)
+        self.email_lower = email.lower()  # Emails are stored as typed; search matches this
+        self.password_hash = hash_password(password)
         self.role = role  # Admin, Manager, Employee
         self.manager_id = manager_id
+        self.ancestors = ancestors or []  # Managers from manager_id up to the top of the tree
+        self.token_version = 0  # Bumped to revoke issued tokens
         self.created_at = datetime.utcnow()
     
     def to_dict(self):
         return {
             'company_id': self.company_id,
             'name': self.name,
+            'name_lower': self.name_lower,
             'email': self.email,
+            'email_lower': self.email_lower,
             'password_hash': self.password_hash,
             'role': self.role,
             'manager_id': self.manager_id,
+            'ancestors': self.ancestors,
+            'token_version': self.token_version,
             'created_at': self.created_at
         }
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(password, self.password_hash)
     
     @staticmethod
     def set_password(password):
-        return generate_password_hash(password)
+        return hash_password(password)
 
 
 class Expense:
-    def __init__(self, company_id, user_id, description, category, amount, currency, expense_date, paid_by, remarks="", status="submitted", approver_id=None):
+    def __init__(self, company_id, user_id, description, category, amount, currency, expense_date, paid_by, remarks="", status="submitted", approver_id=None, amount_company=None, company_currency=None):
         self.company_id = company_id
         self.user_id = user_id
         self.description = description
         self.category = category
         self.amount = float(amount)
         self.currency = currency
+        self.amount_company = amount_company  # amount converted to company_currency at submit time
+        self.company_currency = company_currency
         self.expense_date = expense_date
         self.paid_by = paid_by
         self.remarks = remarks
@@ -73,6 +83,8 @@ class Expense:
             'category': self.category,
             'amount': self.amount,
             'currency': self.currency,
+            'amount_company': self.amount_company,
+            'company_currency': self.company_currency,
             'expense_date': self.expense_date,
             'paid_by': self.paid_by,
             'remarks': self.remarks,
@@ -0,0 +1,93 @@
+from pymongo import UpdateOne
+from app import mongo
+
+# Reporting tree materialised on user documents: ``ancestors`` lists a user's
+# managers from the direct manager up to the top of the tree. A manager's
+# transitive reports are then one multikey index lookup,
+#   users.find({'ancestors': manager_id}),
+# instead of a recursive walk over manager_id.
+
+
+def ancestors_of(manager):
+    """Ancestors for a user reporting to ``manager`` (a user document or None)."""
+    if not manager:
+        return []
+    return [manager['_id']] + list(manager.get('ancestors') or [])
+
+
+def set_manager(user_id, manager_id):
+    """Point ``user_id`` at ``manager_id`` (or None) and re-root its subtree.
+
+    Every report below the user keeps its path up to the user and takes the
+    user's new ancestors after it, in one bulk write. Raises ValueError if
+    the change would make a user report to itself.
+    """
+    manager = None
+    if manager_id:
+        manager = mongo.db.users.find_one({'_id': manager_id}, {'ancestors': 1})
+        if not manager:
+            raise ValueError('Invalid manager ID')
+    ancestors = ancestors_of(manager)
+    if user_id == manager_id or user_id in ancestors:
+        raise ValueError('A user cannot report to themselves or to one of their reports')
+
+    operations = [UpdateOne({'_id': user_id}, {'$set': {'manager_id': manager_id, 'ancestors': ancestors}})]
+    for report in mongo.db.users.find({'ancestors': user_id}, {'ancestors': 1}):
+        path = report['ancestors']
+        operations.append(UpdateOne(
+            {'_id': report['_id']},
+            {'$set': {'ancestors': path[:path.index(user_id) + 1] + ancestors}}
+        ))
+    mongo.db.users.bulk_write(operations, ordered=True)
+    return ancestors
+
+
+def refresh_ancestors(user_id):
+    """Recompute one user's ancestors from its manager's stored path."""
+    user = mongo.db.users.find_one({'_id': user_id}, {'manager_id': 1})
+    if not user:
+        return None
+    manager = None
+    if user.get('manager_id'):
+        manager = mongo.db.users.find_one({'_id': user['manager_id']}, {'ancestors': 1})
+    ancestors = ancestors_of(manager)
+    mongo.db.users.update_one({'_id': user_id}, {'$set': {'ancestors': ancestors}})
+    return ancestors
+
+
+def get_team_member_ids(manager_id):
+    """Ids of every direct and indirect report of ``manager_id``."""
+    return [user['_id'] for user in mongo.db.users.find({'ancestors': manager_id}, {'_id': 1})]
+
+
+def rebuild_company_tree(company_id):
+    """Recompute ``ancestors`` for every user in a company from ``manager_id``.
+
+    Returns the number of users updated. Users on a manager_id cycle keep
+    the part of the path walked before the cycle repeats.
+    """
+    managers = {
+        user['_id']: user.get('manager_id')
+        for user in mongo.db.users.find({'company_id': company_id}, {'manager_id': 1})
+    }
+
+    operations = []
+    for user_id in managers:
+        ancestors = []
+        manager_id = managers.get(user_id)
+        while manager_id and manager_id in managers and manager_id != user_id and manager_id not in ancestors:
+            ancestors.append(manager_id)
+            manager_id = managers.get(manager_id)
+        operations.append(UpdateOne({'_id': user_id}, {'$set': {'ancestors': ancestors}}))
+
+    if operations:
+        mongo.db.users.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def rebuild_all_trees():
+    """Rebuild the reporting tree for every company; returns the number of companies."""
+    company_ids = mongo.db.companies.distinct('_id')
+    for company_id in company_ids:
+        rebuild_company_tree(company_id)
+    return len(company_ids)
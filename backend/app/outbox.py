@@ -0,0 +1,228 @@
+import atexit
+import logging
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask_mail import Message
+from pymongo import ReturnDocument
+from app import mongo, mail
+
+logger = logging.getLogger(__name__)
+
+# Outbox documents live in the mail_outbox collection:
+#   {subject, recipients, body, status, attempts, next_attempt_at,
+#    locked_until, last_error, created_at, sent_at}
+# status moves pending -> sending -> sent, or back to pending with a later
+# next_attempt_at after a failure, and to failed after MAIL_OUTBOX_MAX_ATTEMPTS.
+
+
+def enqueue_mail(subject, recipients, body):
+    """Store a message in the outbox and wake the delivery workers.
+
+    Request handlers call this instead of ``mail.send`` so they never wait
+    on SMTP. Starts the delivery workers in this process if they are not
+    running yet. Returns the outbox document id.
+    """
+    now = datetime.utcnow()
+    result = mongo.db.mail_outbox.insert_one({
+        'subject': subject,
+        'recipients': list(recipients),
+        'body': body,
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'locked_until': None,
+        'last_error': None,
+        'created_at': now,
+        'sent_at': None
+    })
+    outbox.wake()
+    return result.inserted_id
+
+
+class MailOutbox:
+    """Background sender for the mail outbox.
+
+    A dispatcher thread claims due messages one at a time with an atomic
+    ``find_one_and_update`` (so several processes can share the outbox) and
+    hands them to a thread pool. Each pool thread keeps its SMTP connection
+    open between messages. Failed sends are retried with exponential backoff.
+
+    The threads start lazily, on the first request or the first enqueued
+    message, so CLI commands, spawned worker processes and the reloader's
+    parent process never run them.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._slots = None
+        self._local = threading.local()
+        self._executor = None
+        self._dispatcher = None
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('MAIL_OUTBOX_WORKERS', 2)
+        app.config.setdefault('MAIL_OUTBOX_POLL_INTERVAL', 5)
+        app.config.setdefault('MAIL_OUTBOX_MAX_ATTEMPTS', 6)
+        app.config.setdefault('MAIL_OUTBOX_RETRY_BASE', 30)
+        app.config.setdefault('MAIL_OUTBOX_LOCK_TIMEOUT', 300)
+        app.extensions['mail_outbox'] = self
+        app.before_request(self._start_on_request)
+
+    def _start_on_request(self):
+        # Serving processes deliver the backlog left by earlier runs without waiting for new mail
+        if self._dispatcher is None:
+            self.start()
+
+    def start(self):
+        """Start the dispatcher and sender threads (no-op if workers is 0)."""
+        workers = self.app.config['MAIL_OUTBOX_WORKERS']
+        if workers <= 0 or self._dispatcher is not None:
+            return
+
+        with self._start_lock:
+            if self._dispatcher is not None or self._stopping.is_set():
+                return
+            self._slots = threading.BoundedSemaphore(workers)
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mail-outbox')
+            self._dispatcher = threading.Thread(target=self._run, name='mail-outbox-dispatcher', daemon=True)
+            self._dispatcher.start()
+            atexit.register(self.stop)
+
+    def stop(self, wait=True):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout=10)
+            self._dispatcher = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        poll_interval = self.app.config['MAIL_OUTBOX_POLL_INTERVAL']
+        while not self._stopping.is_set():
+            # Cleared before claiming so a wake() during the claim loop is not lost
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    while not self._stopping.is_set():
+                        # Only claim a message when a sender is free to take it
+                        self._slots.acquire()
+                        try:
+                            message = self._claim()
+                        except Exception:
+                            self._slots.release()
+                            raise
+                        if message is None:
+                            self._slots.release()
+                            break
+                        self._executor.submit(self._deliver, message)
+            except Exception as e:
+                logger.warning("Mail outbox dispatcher error: %s", e)
+
+            self._wakeup.wait(poll_interval)
+
+    def _claim(self):
+        now = datetime.utcnow()
+        lock_timeout = self.app.config['MAIL_OUTBOX_LOCK_TIMEOUT']
+        return mongo.db.mail_outbox.find_one_and_update(
+            {
+                '$or': [
+                    {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+                    # Messages left behind by a sender that died mid-delivery
+                    {'status': 'sending', 'locked_until': {'$lte': now}}
+                ]
+            },
+            {
+                '$set': {'status': 'sending', 'locked_until': now + timedelta(seconds=lock_timeout)},
+                '$inc': {'attempts': 1}
+            },
+            sort=[('next_attempt_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = mail.connect()
+            connection.__enter__()
+            self._local.connection = connection
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+
+    def _send(self, message):
+        try:
+            self._connection().send(message)
+        except smtplib.SMTPServerDisconnected:
+            # The reused connection timed out while idle; reconnect once
+            self._drop_connection()
+            self._connection().send(message)
+
+    def _deliver(self, doc):
+        try:
+            with self.app.app_context():
+                try:
+                    self._send(Message(doc['subject'], recipients=doc['recipients'], body=doc['body']))
+                except Exception as e:
+                    self._drop_connection()
+                    self._record_failure(doc, e)
+                    return
+
+                # The body can contain credentials, so it is not kept after delivery
+                mongo.db.mail_outbox.update_one(
+                    {'_id': doc['_id']},
+                    {'$set': {'status': 'sent', 'sent_at': datetime.utcnow(), 'locked_until': None, 'last_error': None},
+                     '$unset': {'body': ''}}
+                )
+        except Exception as e:
+            logger.warning("Mail outbox delivery error for %s: %s", doc['_id'], e)
+        finally:
+            self._slots.release()
+
+    def _record_failure(self, doc, error):
+        max_attempts = self.app.config['MAIL_OUTBOX_MAX_ATTEMPTS']
+        if doc['attempts'] >= max_attempts:
+            logger.warning(
+                "Giving up on mail %s after %d attempts: %s", doc['_id'], doc['attempts'], error
+            )
+            mongo.db.mail_outbox.update_one(
+                {'_id': doc['_id']},
+                {'$set': {'status': 'failed', 'locked_until': None, 'last_error': str(error)},
+                 '$unset': {'body': ''}}
+            )
+            return
+
+        # Exponential backoff: base, 2 x base, 4 x base, ...
+        delay = self.app.config['MAIL_OUTBOX_RETRY_BASE'] * 2 ** (doc['attempts'] - 1)
+        mongo.db.mail_outbox.update_one(
+            {'_id': doc['_id']},
+            {'$set': {
+                'status': 'pending',
+                'next_attempt_at': datetime.utcnow() + timedelta(seconds=delay),
+                'locked_until': None,
+                'last_error': str(error)
+            }}
+        )
+
+
+outbox = MailOutbox()
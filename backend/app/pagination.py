@@ -0,0 +1,90 @@
+import base64
+import binascii
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Page size limits for list endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse the ``limit`` query parameter, clamped to ``maximum``."""
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except (ValueError, TypeError):
+        raise ValueError('limit must be an integer')
+    if limit <= 0:
+        raise ValueError('limit must be greater than 0')
+    return min(limit, maximum)
+
+
+def encode_cursor(sort_value, document_id):
+    """Build an opaque cursor from the sort key of the last row on a page.
+
+    Datetime sort keys are stored as ISO strings, text sort keys with an
+    ``s:`` prefix.
+    """
+    if isinstance(sort_value, datetime):
+        value = sort_value.isoformat()
+    else:
+        value = f"s:{sort_value}"
+    raw = f"{value}|{document_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the ``(sort_value, _id)`` pair stored in a cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        value, document_id = raw.rsplit('|', 1)
+        if value.startswith('s:'):
+            return value[2:], ObjectId(document_id)
+        return datetime.fromisoformat(value), ObjectId(document_id)
+    except (ValueError, TypeError, UnicodeError, binascii.Error, InvalidId):
+        raise ValueError('Invalid cursor')
+
+
+def keyset_page(collection, query, projection=None, limit=DEFAULT_PAGE_SIZE, cursor=None, direction=-1,
+                sort_field='submitted_at'):
+    """Fetch one page of ``collection`` ordered by ``(sort_field, _id)``.
+
+    The cursor is turned into a range predicate on the sort key, so every page
+    is a single bounded index scan no matter how deep the client pages.
+    Returns ``(documents, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    query = dict(query)
+    if cursor:
+        last_value, last_id = decode_cursor(cursor)
+        op = '$lt' if direction < 0 else '$gt'
+        after_cursor = [
+            {sort_field: {op: last_value}},
+            {sort_field: last_value, '_id': {op: last_id}}
+        ]
+        if '$or' in query:
+            query.setdefault('$and', []).append({'$or': after_cursor})
+        else:
+            query['$or'] = after_cursor
+
+    if projection is not None:
+        projection = dict(projection)
+        projection.setdefault(sort_field, 1)
+
+    # Fetch one extra row to know whether another page exists
+    documents = list(
+        collection.find(query, projection)
+        .sort([(sort_field, direction), ('_id', direction)])
+        .limit(limit + 1)
+    )
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        next_cursor = encode_cursor(last[sort_field], last['_id'])
+
+    return documents, next_cursor
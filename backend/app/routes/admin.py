@@ -1,29 +1,46 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, current_app, request, jsonify, g
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
+import re
 from app import mongo
 from app.models import ApprovalChain
+from app.decorators import user_required
+from app.analytics import GROUP_FIELDS, PERIOD_FORMATS, spend_series
+from app.caching import RebuildConflict
+from app.currency import get_company_currency
+from app.stats import compute_company_dashboard, get_company_stats, rebuild_company_stats
+from app.lookups import get_user_map
+from app.slow_queries import worst_routes
+from app.approvals import invalidate_approval_chain, sort_approvers
 
 admin_bp = Blueprint('admin', __name__)
 
+# Spenders returned by /admin/expenses/dashboard unless ?top= is given
+DEFAULT_TOP_SPENDERS = 5
+MAX_TOP_SPENDERS = 50
+
+# Default window for /admin/analytics/spend when no dates are given
+DEFAULT_ANALYTICS_DAYS = 90
+
+# Longest range /admin/analytics/spend accepts
+MAX_ANALYTICS_DAYS = 3 * 366
+
+STATUS_PATTERN = re.compile(r'^[A-Za-z]+$')
+
+# Window and row count for /admin/slow-queries unless ?hours= / ?limit= are given
+DEFAULT_SLOW_QUERY_HOURS = 24
+MAX_SLOW_QUERY_HOURS = 7 * 24
+DEFAULT_SLOW_QUERY_ROUTES = 20
+MAX_SLOW_QUERY_ROUTES = 100
+
 
 @admin_bp.route('/approval-chain', methods=['POST'])
-@jwt_required()
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
 def set_approval_chain():
     try:
-        current_user_id = get_jwt_identity()
+        current_user = g.current_user
         data = request.get_json()
         
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Only Admin can set approval chain
-        if current_user['role'] != 'Admin':
-            return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
-        
         # Validate required fields
         if 'approvers' not in data:
             return jsonify({'error': 'approvers is required'}), 400
@@ -52,14 +69,18 @@ def set_approval_chain():
             if user['role'] not in ['Manager', 'Admin']:
                 return jsonify({'error': f'User {user["name"]} must be a Manager or Admin to be an approver'}), 400
         
+        # Store the chain already sorted so submissions never re-sort it
+        approvers = sort_approvers(approvers)
+        
         # Check if approval chain already exists for this company
         existing_chain = mongo.db.approval_chains.find_one({'company_id': current_user['company_id']})
         
         if existing_chain:
-            # Update existing chain
+            # Update existing chain and bump its version stamp for other workers
             mongo.db.approval_chains.update_one(
                 {'company_id': current_user['company_id']},
-                {'$set': {'approvers': approvers, 'updated_at': datetime.utcnow()}}
+                {'$set': {'approvers': approvers, 'updated_at': datetime.utcnow()},
+                 '$inc': {'version': 1}}
             )
             message = 'Approval settings updated successfully'
         else:
@@ -67,12 +88,15 @@ def set_approval_chain():
             new_chain = {
                 'company_id': current_user['company_id'],
                 'approvers': approvers,
+                'version': 1,
                 'created_at': datetime.utcnow(),
                 'updated_at': datetime.utcnow()
             }
             mongo.db.approval_chains.insert_one(new_chain)
             message = 'Approval settings created successfully'
         
+        invalidate_approval_chain(current_user['company_id'])
+        
         return jsonify({
             'message': message,
             'approvers': approvers
@@ -83,19 +107,10 @@ def set_approval_chain():
 
 
 @admin_bp.route('/approval-chain', methods=['GET'])
-@jwt_required()
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
 def get_approval_chain():
     try:
-        current_user_id = get_jwt_identity()
-        
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Only Admin can view approval chain
-        if current_user['role'] != 'Admin':
-            return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
+        current_user = g.current_user
         
         # Get approval chain for this company
         approval_chain = mongo.db.approval_chains.find_one({'company_id': current_user['company_id']})
@@ -136,48 +151,218 @@ def get_approval_chain():
 
 
 @admin_bp.route('/expenses/stats', methods=['GET'])
-@jwt_required()
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
 def get_expense_stats():
     try:
-        current_user_id = get_jwt_identity()
-        
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Only Admin can view expense stats
-        if current_user['role'] != 'Admin':
-            return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
-        
-        # Get expense statistics
-        pipeline = [
-            {'$match': {'company_id': current_user['company_id']}},
-            {'$group': {
-                '_id': '$status',
-                'count': {'$sum': 1},
-                'total_amount': {'$sum': '$amount'}
-            }}
-        ]
-        
-        stats = list(mongo.db.expenses.aggregate(pipeline))
-        
-        # Get total expenses
-        total_expenses = mongo.db.expenses.count_documents({'company_id': current_user['company_id']})
-        
-        # Get total amount
-        total_amount_pipeline = [
-            {'$match': {'company_id': current_user['company_id']}},
-            {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
-        ]
-        total_amount_result = list(mongo.db.expenses.aggregate(total_amount_pipeline))
-        total_amount = total_amount_result[0]['total'] if total_amount_result else 0
+        current_user = g.current_user
+        
+        # Read the incrementally maintained rollup
+        stats = get_company_stats(current_user['company_id'])
+        
+        return jsonify(_format_stats(stats)), 200
+    
+    except RebuildConflict as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/expenses/stats/rebuild', methods=['POST'])
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
+def rebuild_expense_stats():
+    try:
+        current_user = g.current_user
+        
+        # Recompute the rollup from scratch to repair any drift
+        stats = rebuild_company_stats(current_user['company_id'])
+        
+        return jsonify({
+            'message': 'Expense statistics rebuilt successfully',
+            **_format_stats(stats)
+        }), 200
+    
+    except RebuildConflict as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/expenses/dashboard', methods=['GET'])
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
+def get_expense_dashboard():
+    try:
+        current_user = g.current_user
+        
+        # Validate top spenders count
+        try:
+            top = int(request.args.get('top', DEFAULT_TOP_SPENDERS))
+        except ValueError:
+            return jsonify({'error': 'top must be an integer'}), 400
+        if top < 1 or top > MAX_TOP_SPENDERS:
+            return jsonify({'error': f'top must be between 1 and {MAX_TOP_SPENDERS}'}), 400
+        
+        # Every widget comes from one $facet pass over the company's expenses
+        dashboard = compute_company_dashboard(current_user['company_id'], top_spenders=top)
+        
+        # Resolve spender names with one batched lookup
+        users = get_user_map([row['_id'] for row in dashboard['top_spenders']])
+        
+        return jsonify({
+            'currency': dashboard['currency'],
+            'total_expenses': dashboard['total_expenses'],
+            'total_amount': dashboard['total_amount'],
+            # Expenses left out of the amounts until `flask db backfill-amounts` converts them
+            'unconverted_expenses': dashboard['unconverted_expenses'],
+            'status_breakdown': [_format_row(row) for row in dashboard['by_status']],
+            'category_breakdown': [_format_row(row) for row in dashboard['by_category']],
+            'top_spenders': [
+                {
+                    'user_id': str(row['_id']),
+                    'name': users[row['_id']]['name'] if row['_id'] in users else 'Unknown',
+                    'count': row['count'],
+                    'total_amount': round(row['total_amount'], 2)
+                }
+                for row in dashboard['top_spenders']
+            ]
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/analytics/spend', methods=['GET'])
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
+def get_spend_analytics():
+    try:
+        current_user = g.current_user
+        
+        # Validate options
+        granularity = request.args.get('granularity', 'month')
+        if granularity not in PERIOD_FORMATS:
+            return jsonify({'error': f'granularity must be one of: {list(PERIOD_FORMATS)}'}), 400
+        
+        group_by = request.args.get('group_by', 'none')
+        if group_by not in GROUP_FIELDS:
+            return jsonify({'error': f'group_by must be one of: {list(GROUP_FIELDS)}'}), 400
+        
+        status = request.args.get('status')
+        if status and not STATUS_PATTERN.match(status):
+            return jsonify({'error': 'Invalid status'}), 400
+        
+        # Validate date range; end_date is inclusive
+        try:
+            if request.args.get('end_date'):
+                end = datetime.strptime(request.args['end_date'], '%Y-%m-%d')
+            else:
+                end = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+            if request.args.get('start_date'):
+                start = datetime.strptime(request.args['start_date'], '%Y-%m-%d')
+            else:
+                start = end - timedelta(days=DEFAULT_ANALYTICS_DAYS)
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        if start > end:
+            return jsonify({'error': 'start_date must not be after end_date'}), 400
+        if (end - start).days > MAX_ANALYTICS_DAYS:
+            return jsonify({'error': f'Date range cannot exceed {MAX_ANALYTICS_DAYS} days'}), 400
+        
+        # Merge the precomputed daily buckets instead of scanning expenses
+        series = spend_series(
+            current_user['company_id'], start, end + timedelta(days=1),
+            granularity=granularity, group_by=group_by, status=status
+        )
+        
+        # Resolve employee names with one batched lookup
+        if group_by == 'user':
+            users = get_user_map([row['key'] for row in series])
+            for row in series:
+                user = users.get(row['key'])
+                row['name'] = user['name'] if user else 'Unknown'
+                row['key'] = str(row['key']) if row['key'] else None
+        
+        return jsonify({
+            'currency': get_company_currency(current_user['company_id']),
+            'granularity': granularity,
+            'group_by': group_by,
+            'start_date': start.strftime('%Y-%m-%d'),
+            'end_date': end.strftime('%Y-%m-%d'),
+            'series': series
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/slow-queries', methods=['GET'])
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
+def get_slow_queries():
+    try:
+        current_user = g.current_user
+        
+        # Validate window and row count
+        try:
+            hours = int(request.args.get('hours', DEFAULT_SLOW_QUERY_HOURS))
+            limit = int(request.args.get('limit', DEFAULT_SLOW_QUERY_ROUTES))
+        except ValueError:
+            return jsonify({'error': 'hours and limit must be integers'}), 400
+        if hours < 1 or hours > MAX_SLOW_QUERY_HOURS:
+            return jsonify({'error': f'hours must be between 1 and {MAX_SLOW_QUERY_HOURS}'}), 400
+        if limit < 1 or limit > MAX_SLOW_QUERY_ROUTES:
+            return jsonify({'error': f'limit must be between 1 and {MAX_SLOW_QUERY_ROUTES}'}), 400
+        
+        # Routes with the most time spent in slow commands first
+        since = datetime.utcnow() - timedelta(hours=hours)
+        rows = worst_routes(current_user['company_id'], since, limit)
+        
+        routes = []
+        for row in rows:
+            worst = row['worst']
+            routes.append({
+                'route': row['_id'].get('route'),
+                'method': row['_id'].get('method'),
+                'count': row['count'],
+                'total_ms': round(row['total_ms'], 1),
+                'avg_ms': round(row['avg_ms'], 1),
+                'max_ms': round(row['max_ms'], 1),
+                'collscans': row['collscans'],
+                'worst': {
+                    'ts': worst['ts'].isoformat(),
+                    'collection': worst.get('collection'),
+                    'command': worst.get('command'),
+                    'outcome': worst.get('outcome'),
+                    'duration_ms': worst.get('duration_ms'),
+                    'filter': worst.get('filter'),
+                    'sort': worst.get('sort'),
+                    'plan': worst.get('plan'),
+                    'explain_error': worst.get('explain_error')
+                }
+            })
         
         return jsonify({
-            'total_expenses': total_expenses,
-            'total_amount': total_amount,
-            'status_breakdown': stats
+            'hours': hours,
+            'threshold_ms': current_app.config['SLOW_QUERY_MS'],
+            'routes': routes
         }), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+def _format_row(row):
+    return {'_id': row['_id'], 'count': row['count'], 'total_amount': round(row['total_amount'], 2)}
+
+
+def _format_stats(stats):
+    # Statuses whose expenses were all deleted or moved keep zeroed counters;
+    # amounts are rounded because float $incs accumulate representation error
+    status_breakdown = [
+        {'_id': status, 'count': values['count'], 'total_amount': round(values['total_amount'], 2)}
+        for status, values in stats.get('by_status', {}).items()
+        if values.get('count')
+    ]
+    return {
+        'currency': stats.get('currency'),
+        'total_expenses': stats.get('total_expenses', 0),
+        'total_amount': round(stats.get('total_amount', 0), 2),
+        'status_breakdown': status_breakdown
+    }
@@ -1,12 +1,13 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import check_password_hash
-from flask_mail import Message
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 import string
 import random
-from app import mongo, mail
+from app import mongo
 from app.models import Company, User
+from app.decorators import create_user_token, invalidate_token_version
+from app.hashing import HashingBusy, hash_password, verify_password, needs_rehash
+from app.outbox import enqueue_mail
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -52,8 +53,8 @@ def signup():
             {'$set': {'admin_id': user_result.inserted_id}}
         )
         
-        # Create JWT token
-        access_token = create_access_token(identity=str(user_result.inserted_id))
+        # Create JWT token with role and company claims
+        access_token = create_user_token({'_id': user_result.inserted_id, **admin_user.to_dict()})
         
         return jsonify({
             'message': 'Company and admin user created successfully',
@@ -67,6 +68,8 @@ def signup():
             }
         }), 201
     
+    except HashingBusy:
+        return jsonify({'error': 'Server is busy, please try again'}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -89,11 +92,18 @@ def login():
             return jsonify({'error': 'Invalid email or password'}), 401
         
         # Check password
-        if not check_password_hash(user['password_hash'], password):
+        if not verify_password(password, user['password_hash']):
             return jsonify({'error': 'Invalid email or password'}), 401
         
-        # Create JWT token
-        access_token = create_access_token(identity=str(user['_id']))
+        # Upgrade hashes made with an older scheme or cost while we have the password
+        if needs_rehash(user['password_hash']):
+            mongo.db.users.update_one(
+                {'_id': user['_id'], 'password_hash': user['password_hash']},
+                {'$set': {'password_hash': hash_password(password)}}
+            )
+        
+        # Create JWT token with role and company claims
+        access_token = create_user_token(user)
         
         # Get company info
         company = mongo.db.companies.find_one({'_id': user['company_id']})
@@ -111,6 +121,8 @@ def login():
             }
         }), 200
     
+    except HashingBusy:
+        return jsonify({'error': 'Server is busy, please try again'}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -133,19 +145,19 @@ def forgot_password():
         # Generate random password
         new_password = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
         
-        # Update password in database
+        # Update password in database and revoke existing tokens
         hashed_password = User.set_password(new_password)
         mongo.db.users.update_one(
             {'_id': user['_id']},
-            {'$set': {'password_hash': hashed_password}}
+            {'$set': {'password_hash': hashed_password}, '$inc': {'token_version': 1}}
         )
+        invalidate_token_version(user['_id'])
         
-        # Try sending email, fallback to console if email fails
-        try:
-            msg = Message(
-                'Password Reset - Oddu App',
-                recipients=[email],
-                body=f'''
+        # Queue the email; the outbox workers deliver and retry it in the background
+        enqueue_mail(
+            'Password Reset - Oddu App',
+            [email],
+            f'''
 Hello {user['name']},
 
 Your password has been reset. Your new password is: {new_password}
@@ -155,27 +167,14 @@ Please log in with this new password and consider changing it to something more
 Best regards,
 Oddu Team
                 '''
-            )
-            
-            mail.send(msg)
-            
-            return jsonify({
-                'message': 'New password has been sent to your email address'
-            }), 200
-            
-        except Exception as email_error:
-            # If email fails, log to console as fallback
-            print("=" * 60)
-            print(f"🔑 EMAIL FAILED - PASSWORD RESET FOR: {email}")
-            print(f"🔑 NEW PASSWORD: {new_password}")
-            print(f"🔑 EMAIL ERROR: {email_error}")
-            print("=" * 60)
-            
-            return jsonify({
-                'message': 'Password reset successful. Check the server console for your new password.',
-                'note': 'Email service temporarily unavailable.'
-            }), 200, 200
+        )
+        
+        return jsonify({
+            'message': 'New password has been sent to your email address'
+        }), 200
     
+    except HashingBusy:
+        return jsonify({'error': 'Server is busy, please try again'}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -193,23 +192,32 @@ def reset_password():
         current_password = data['current_password']
         new_password = data['new_password']
         
-        # Find user
-        user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
+        # Find user (the shared current-user loader never loads password hashes)
+        user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)}, {'password_hash': 1, 'token_version': 1, 'role': 1, 'company_id': 1, 'manager_id': 1})
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
         # Check current password
-        if not check_password_hash(user['password_hash'], current_password):
+        if not verify_password(current_password, user['password_hash']):
             return jsonify({'error': 'Current password is incorrect'}), 401
         
-        # Update password
+        # Update password and revoke tokens issued with the old one
         hashed_password = User.set_password(new_password)
         mongo.db.users.update_one(
             {'_id': ObjectId(current_user_id)},
-            {'$set': {'password_hash': hashed_password}}
+            {'$set': {'password_hash': hashed_password}, '$inc': {'token_version': 1}}
         )
+        invalidate_token_version(current_user_id)
+        
+        # Hand back a token for the new version so this session stays signed in
+        user['token_version'] = user.get('token_version', 0) + 1
         
-        return jsonify({'message': 'Password updated successfully'}), 200
+        return jsonify({
+            'message': 'Password updated successfully',
+            'access_token': create_user_token(user)
+        }), 200
     
+    except HashingBusy:
+        return jsonify({'error': 'Server is busy, please try again'}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -1,12 +1,33 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, g, Response, stream_with_context
+from flask_jwt_extended import jwt_required
 from bson import ObjectId
-from datetime import datetime
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timedelta
+import csv
+import io
+import json
+import logging
 from app import mongo
 from app.models import Expense
+from app.decorators import user_required
+from app.caching import bump_collection_version, static_etag, versioned_etag
+from app.stats import record_expense_created, record_status_change
+from app.analytics import record_bucket_changes
+from app.approvals import get_approval_chain
+from app.currency import company_amount, convert_expenses, get_company_currency, to_company_currency
+from app.filters import apply_filters, cached_facet_counts, parse_expense_filters, wants_facets
+from app.org import get_team_member_ids
+from app.lookups import get_user_map, UserNameCache
+from app.pagination import keyset_page, parse_limit
+from app.search import SEARCH_PROJECTION, search_expenses
+from app.serializers import get_serializer
 
 expenses_bp = Blueprint('expenses', __name__)
 
+logger = logging.getLogger(__name__)
+
 # Categories for expenses
 EXPENSE_CATEGORIES = [
     "Travel", "Meals", "Office Supplies", "Software", "Training", 
@@ -28,84 +49,133 @@ PAYMENT_METHODS = [
     "Cash", "Credit Card", "Debit Card", "Bank Transfer", "Company Card", "Personal"
 ]
 
+# Fields returned by /expenses/my-expenses
+MY_EXPENSES_PROJECTION = {
+    '_id': 1, 'description': 1, 'category': 1, 'amount': 1, 'currency': 1,
+    'expense_date': 1, 'paid_by': 1, 'remarks': 1, 'status': 1, 'submitted_at': 1
+}
+
+# Columns written by /expenses/export, in output order
+EXPORT_FIELDS = [
+    "id", "submitted_at", "expense_date", "employee_name", "description", "category",
+    "amount", "currency", "paid_by", "status", "approver_name", "approved_at",
+    "remarks", "approval_remarks"
+]
+
+# Rows pulled from the cursor and flushed to the client at a time
+EXPORT_BATCH_SIZE = 500
+
+# Maximum number of expenses accepted by /expenses/submit-batch
+MAX_SUBMIT_BATCH_SIZE = 500
+
+# Maximum number of expenses accepted by /expenses/approve-bulk
+MAX_BULK_APPROVAL_SIZE = 500
+
+# Longest query and deepest offset accepted by /expenses/search
+MAX_SEARCH_QUERY_LENGTH = 200
+MAX_SEARCH_OFFSET = 1000
+
+# Statuses an approver can still act on
+APPROVABLE_STATUSES = ['submitted', 'pending']
+
+NO_APPROVER_ERROR = 'No approval settings configured and no manager assigned. Contact admin to configure approval settings or assign a manager.'
+
+
+def _validate_expense(data):
+    """Validate a submitted expense payload.
+
+    Returns ``(fields, None)`` with the parsed values, or ``(None, error)``.
+    """
+    if not isinstance(data, dict):
+        return None, 'Expense must be an object'
+    
+    # Validate required fields
+    required_fields = ['description', 'category', 'amount', 'currency', 'expense_date', 'paid_by']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            return None, f'{field} is required'
+    
+    # Validate category
+    if data['category'] not in EXPENSE_CATEGORIES:
+        return None, f'Invalid category. Must be one of: {EXPENSE_CATEGORIES}'
+    
+    # Validate currency
+    valid_currencies = [c['code'] for c in CURRENCIES]
+    if data['currency'] not in valid_currencies:
+        return None, f'Invalid currency. Must be one of: {valid_currencies}'
+    
+    # Validate amount
+    try:
+        amount = float(data['amount'])
+        if amount <= 0:
+            return None, 'Amount must be greater than 0'
+    except (ValueError, TypeError):
+        return None, 'Invalid amount format'
+    
+    # Validate date format
+    try:
+        expense_date = datetime.strptime(data['expense_date'], '%Y-%m-%d')
+    except (ValueError, TypeError):
+        return None, 'Invalid date format. Use YYYY-MM-DD'
+    
+    return {
+        'description': data['description'],
+        'category': data['category'],
+        'amount': amount,
+        'currency': data['currency'],
+        'expense_date': expense_date,
+        'paid_by': data['paid_by'],
+        'remarks': data.get('remarks', '')
+    }, None
+
+
+def _resolve_approver(current_user):
+    """Return the approver for the user's submissions, or None if there is none."""
+    # First, check if there are approval settings configured (cached, sorted by order)
+    approvers = get_approval_chain(current_user['company_id'])
+    
+    if approvers:
+        # Use the first approver in the approval chain
+        return ObjectId(approvers[0]['user_id'])
+    
+    # Fallback to employee's assigned manager
+    return current_user.get('manager_id')
+
 
 @expenses_bp.route('/submit', methods=['POST'])
-@jwt_required()
+@user_required(roles=['Employee'], message='Only employees can submit expenses')
 def submit_expense():
     try:
-        current_user_id = get_jwt_identity()
+        current_user = g.current_user
         data = request.get_json()
         
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Check if user is employee
-        if current_user['role'] != 'Employee':
-            return jsonify({'error': 'Only employees can submit expenses'}), 403
-        
-        # Validate required fields
-        required_fields = ['description', 'category', 'amount', 'currency', 'expense_date', 'paid_by']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'{field} is required'}), 400
-        
-        # Validate category
-        if data['category'] not in EXPENSE_CATEGORIES:
-            return jsonify({'error': f'Invalid category. Must be one of: {EXPENSE_CATEGORIES}'}), 400
-        
-        # Validate currency
-        valid_currencies = [c['code'] for c in CURRENCIES]
-        if data['currency'] not in valid_currencies:
-            return jsonify({'error': f'Invalid currency. Must be one of: {valid_currencies}'}), 400
-        
-        # Validate amount
-        try:
-            amount = float(data['amount'])
-            if amount <= 0:
-                return jsonify({'error': 'Amount must be greater than 0'}), 400
-        except (ValueError, TypeError):
-            return jsonify({'error': 'Invalid amount format'}), 400
-        
-        # Validate date format
-        try:
-            expense_date = datetime.strptime(data['expense_date'], '%Y-%m-%d')
-        except ValueError:
-            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        # Validate the payload
+        fields, error = _validate_expense(data)
+        if error:
+            return jsonify({'error': error}), 400
         
         # Determine approver based on approval settings
-        # First, check if there are approval settings configured
-        approval_settings = mongo.db.approval_chains.find_one({'company_id': current_user['company_id']})
-        
-        if approval_settings and approval_settings.get('approvers'):
-            # Use the first approver in the approval chain
-            approvers = approval_settings['approvers']
-            # Sort by order to get the first approver
-            approvers.sort(key=lambda x: x.get('order', 0))
-            first_approver = approvers[0]
-            approver_id = ObjectId(first_approver['user_id'])
-        else:
-            # Fallback to employee's assigned manager
-            approver_id = current_user.get('manager_id')
-            if not approver_id:
-                return jsonify({'error': 'No approval settings configured and no manager assigned. Contact admin to configure approval settings or assign a manager.'}), 400
+        approver_id = _resolve_approver(current_user)
+        if not approver_id:
+            return jsonify({'error': NO_APPROVER_ERROR}), 400
         
-        # Create expense
+        # Create expense, storing the amount in company currency for reporting
         expense = Expense(
             company_id=current_user['company_id'],
-            user_id=ObjectId(current_user_id),
-            description=data['description'],
-            category=data['category'],
-            amount=amount,
-            currency=data['currency'],
-            expense_date=expense_date,
-            paid_by=data['paid_by'],
-            remarks=data.get('remarks', ''),
-            approver_id=approver_id
+            user_id=current_user['_id'],
+            approver_id=approver_id,
+            amount_company=to_company_currency(
+                current_user['company_id'], fields['amount'], fields['currency'], fields['expense_date']
+            ),
+            company_currency=get_company_currency(current_user['company_id']),
+            **fields
         )
         
-        result = mongo.db.expenses.insert_one(expense.to_dict())
+        document = expense.to_dict()
+        result = mongo.db.expenses.insert_one(document)
+        bump_collection_version('expenses', current_user['company_id'])
+        record_expense_created(current_user['company_id'], expense.amount_company, expense.status)
+        record_bucket_changes(current_user['company_id'], added=[document])
         
         return jsonify({
             'message': 'Expense submitted successfully',
@@ -116,73 +186,156 @@ def submit_expense():
         return jsonify({'error': str(e)}), 500
 
 
+@expenses_bp.route('/submit-batch', methods=['POST'])
+@user_required(roles=['Employee'], message='Only employees can submit expenses')
+def submit_expense_batch():
+    try:
+        current_user = g.current_user
+        data = request.get_json()
+        
+        # Validate batch structure
+        if not data or 'expenses' not in data:
+            return jsonify({'error': 'expenses is required'}), 400
+        
+        items = data['expenses']
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'expenses must be a non-empty list'}), 400
+        if len(items) > MAX_SUBMIT_BATCH_SIZE:
+            return jsonify({'error': f'A batch can contain at most {MAX_SUBMIT_BATCH_SIZE} expenses'}), 400
+        
+        # Resolve the approver once for the whole batch
+        approver_id = _resolve_approver(current_user)
+        if not approver_id:
+            return jsonify({'error': NO_APPROVER_ERROR}), 400
+        
+        # Validate every item with the same rules as /submit
+        results = [None] * len(items)
+        expenses = []
+        indexes = []
+        for index, item in enumerate(items):
+            fields, error = _validate_expense(item)
+            if error:
+                results[index] = {'index': index, 'error': error}
+                continue
+            expenses.append(Expense(
+                company_id=current_user['company_id'],
+                user_id=current_user['_id'],
+                approver_id=approver_id,
+                **fields
+            ))
+            indexes.append(index)
+        
+        # Convert the whole batch into company currency at once
+        if expenses:
+            company_currency = get_company_currency(current_user['company_id'])
+            amounts = convert_expenses(current_user['company_id'], [expense.to_dict() for expense in expenses])
+            for expense, amount in zip(expenses, amounts):
+                expense.amount_company = float(amount)
+                expense.company_currency = company_currency
+        
+        # Write all valid items in one round trip
+        inserted = []
+        inserted_documents = []
+        if expenses:
+            documents = [expense.to_dict() for expense in expenses]
+            failed = {}
+            try:
+                mongo.db.expenses.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                failed = {error['index']: error.get('errmsg', 'Insert failed') for error in e.details.get('writeErrors', [])}
+            
+            for position, document in enumerate(documents):
+                index = indexes[position]
+                if position in failed:
+                    results[index] = {'index': index, 'error': failed[position]}
+                else:
+                    results[index] = {'index': index, 'expense_id': str(document['_id'])}
+                    inserted.append(expenses[position])
+                    inserted_documents.append(document)
+        
+        if inserted:
+            bump_collection_version('expenses', current_user['company_id'])
+            record_expense_created(
+                current_user['company_id'],
+                sum(expense.amount_company for expense in inserted),
+                inserted[0].status,
+                count=len(inserted)
+            )
+            record_bucket_changes(current_user['company_id'], added=inserted_documents)
+        
+        # 201 when everything was stored, 207 on partial success, 400 when nothing was
+        if len(inserted) == len(items):
+            status_code = 201
+        elif inserted:
+            status_code = 207
+        else:
+            status_code = 400
+        
+        return jsonify({
+            'message': f'{len(inserted)} of {len(items)} expenses submitted successfully',
+            'submitted': len(inserted),
+            'failed': len(items) - len(inserted),
+            'results': results
+        }), status_code
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @expenses_bp.route('/my-expenses', methods=['GET'])
-@jwt_required()
+@user_required()
+@versioned_etag('expenses')
 def get_my_expenses():
     try:
-        current_user_id = get_jwt_identity()
-        
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
+        current_user = g.current_user
         
-        # Get user's expenses
-        expenses = list(mongo.db.expenses.find(
-            {'user_id': ObjectId(current_user_id)},
-            {'_id': 1, 'description': 1, 'category': 1, 'amount': 1, 'currency': 1, 
-             'expense_date': 1, 'paid_by': 1, 'remarks': 1, 'status': 1, 'submitted_at': 1}
-        ).sort('submitted_at', -1))
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            # Get one page of the user's expenses
+            expenses, next_cursor = keyset_page(
+                mongo.db.expenses,
+                {'user_id': current_user['_id']},
+                MY_EXPENSES_PROJECTION,
+                limit=limit,
+                cursor=request.args.get('cursor')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Convert ObjectId to string and format dates
+        serialize = get_serializer(MY_EXPENSES_PROJECTION)
         for expense in expenses:
-            expense['_id'] = str(expense['_id'])
-            if expense.get('company_id'):
-                expense['company_id'] = str(expense['company_id'])
-            expense['expense_date'] = expense['expense_date'].strftime('%Y-%m-%d')
-            expense['submitted_at'] = expense['submitted_at'].strftime('%Y-%m-%d %H:%M')
+            serialize(expense)
         
-        return jsonify({'expenses': expenses}), 200
+        return jsonify({'expenses': expenses, 'next_cursor': next_cursor}), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @expenses_bp.route('/pending-approvals', methods=['GET'])
-@jwt_required()
+@user_required(roles=['Manager'], message='Access denied. Manager privileges required.')
+@versioned_etag('expenses')
 def get_pending_approvals():
     try:
-        current_user_id = get_jwt_identity()
-        
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Check if user is manager
-        if current_user['role'] != 'Manager':
-            return jsonify({'error': 'Access denied. Manager privileges required.'}), 403
+        current_user = g.current_user
         
         # Get expenses pending approval by this user
         expenses = list(mongo.db.expenses.find(
             {
-                'approver_id': ObjectId(current_user_id),
+                'approver_id': current_user['_id'],
                 'status': {'$in': ['submitted', 'pending']}
             }
         ).sort('submitted_at', 1))
         
+        # Resolve all employees on this page with one query
+        employees = get_user_map(expense['user_id'] for expense in expenses)
+        
         # Get employee details for each expense
+        serialize = get_serializer()
         for expense in expenses:
-            expense['_id'] = str(expense['_id'])
-            expense['user_id'] = str(expense['user_id'])
-            expense['approver_id'] = str(expense['approver_id'])
-            if expense.get('company_id'):
-                expense['company_id'] = str(expense['company_id'])
-            expense['expense_date'] = expense['expense_date'].strftime('%Y-%m-%d')
-            expense['submitted_at'] = expense['submitted_at'].strftime('%Y-%m-%d %H:%M')
-            
-            # Get employee details
-            employee = mongo.db.users.find_one({'_id': ObjectId(expense['user_id'])})
+            employee = employees.get(expense['user_id'])
+            serialize(expense)
             expense['employee_name'] = employee['name'] if employee else 'Unknown'
             expense['employee_email'] = employee['email'] if employee else 'Unknown'
         
@@ -193,28 +346,19 @@ def get_pending_approvals():
 
 
 @expenses_bp.route('/approve/<expense_id>', methods=['PUT'])
-@jwt_required()
+@user_required(roles=['Manager'], message='Access denied. Manager privileges required.')
 def approve_expense(expense_id):
     try:
-        current_user_id = get_jwt_identity()
+        current_user = g.current_user
         data = request.get_json()
         
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Check if user is manager
-        if current_user['role'] != 'Manager':
-            return jsonify({'error': 'Access denied. Manager privileges required.'}), 403
-        
         # Get expense
         expense = mongo.db.expenses.find_one({'_id': ObjectId(expense_id)})
         if not expense:
             return jsonify({'error': 'Expense not found'}), 404
         
         # Check if user is authorized to approve this expense
-        if expense['approver_id'] != ObjectId(current_user_id):
+        if expense['approver_id'] != current_user['_id']:
             return jsonify({'error': 'You are not authorized to approve this expense'}), 403
         
         # Validate action
@@ -229,10 +373,22 @@ def approve_expense(expense_id):
             'approval_remarks': data.get('remarks', '')
         }
         
-        mongo.db.expenses.update_one(
-            {'_id': ObjectId(expense_id)},
+        # Only apply the change if the status is still the one read above
+        result = mongo.db.expenses.update_one(
+            {'_id': ObjectId(expense_id), 'status': expense['status']},
             {'$set': update_data}
         )
+        if result.matched_count == 0:
+            return jsonify({'error': 'Expense was modified by another request. Please retry.'}), 409
+        
+        bump_collection_version('expenses', current_user['company_id'])
+        record_status_change(
+            current_user['company_id'],
+            company_amount(expense, current_user['company_id']),
+            expense['status'],
+            update_data['status']
+        )
+        record_bucket_changes(current_user['company_id'], removed=[expense], added=[{**expense, **update_data}])
         
         return jsonify({
             'message': f'Expense {action}ed successfully'
@@ -242,89 +398,408 @@ def approve_expense(expense_id):
         return jsonify({'error': str(e)}), 500
 
 
+@expenses_bp.route('/approve-bulk', methods=['PUT'])
+@user_required(roles=['Manager'], message='Access denied. Manager privileges required.')
+def approve_expenses_bulk():
+    try:
+        current_user = g.current_user
+        data = request.get_json()
+        
+        # Validate action
+        action = data.get('action')  # 'approve' or 'reject'
+        if action not in ['approve', 'reject']:
+            return jsonify({'error': 'Action must be either "approve" or "reject"'}), 400
+        
+        expense_ids = data.get('expense_ids')
+        if not isinstance(expense_ids, list) or not expense_ids:
+            return jsonify({'error': 'expense_ids must be a non-empty list'}), 400
+        if len(expense_ids) > MAX_BULK_APPROVAL_SIZE:
+            return jsonify({'error': f'At most {MAX_BULK_APPROVAL_SIZE} expenses can be processed at once'}), 400
+        
+        # Parse ids, remembering which ones are malformed
+        results = {}
+        object_ids = {}
+        for expense_id in expense_ids:
+            try:
+                object_ids[str(expense_id)] = ObjectId(expense_id)
+            except (InvalidId, TypeError):
+                results[str(expense_id)] = 'invalid_id'
+        
+        # Check authorization for every expense with one query
+        expenses = {
+            expense['_id']: expense
+            for expense in mongo.db.expenses.find(
+                {'_id': {'$in': list(object_ids.values())}},
+                {'approver_id': 1, 'status': 1, 'amount': 1, 'currency': 1, 'expense_date': 1, 'amount_company': 1,
+                 'category': 1, 'user_id': 1}
+            )
+        }
+        
+        new_status = 'approved' if action == 'approve' else 'rejected'
+        # Truncated to the millisecond precision MongoDB stores, so it can be matched below
+        now = datetime.utcnow()
+        approved_at = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        update_data = {
+            'status': new_status,
+            'approved_at': approved_at,
+            'approval_remarks': data.get('remarks', '')
+        }
+        
+        operations = []
+        pending = {}
+        for expense_id, object_id in object_ids.items():
+            expense = expenses.get(object_id)
+            if not expense:
+                results[expense_id] = 'not_found'
+            elif expense.get('approver_id') != current_user['_id']:
+                results[expense_id] = 'not_authorized'
+            elif expense.get('status') not in APPROVABLE_STATUSES:
+                results[expense_id] = 'not_approvable'
+            else:
+                # The status guard skips expenses another request acted on meanwhile
+                operations.append(UpdateOne(
+                    {'_id': object_id, 'approver_id': current_user['_id'], 'status': expense['status']},
+                    {'$set': update_data}
+                ))
+                pending[expense_id] = expense
+        
+        # Apply every status change in one round trip
+        if operations:
+            write_result = mongo.db.expenses.bulk_write(operations, ordered=False)
+            applied = set(pending)
+            if write_result.modified_count < len(operations):
+                # Some expenses changed since they were read; find which updates landed
+                landed = mongo.db.expenses.find(
+                    {'_id': {'$in': [expense['_id'] for expense in pending.values()]},
+                     'status': new_status, 'approved_at': approved_at},
+                    {'_id': 1}
+                )
+                applied = {str(expense['_id']) for expense in landed}
+            
+            moved = {}
+            for expense_id, expense in pending.items():
+                if expense_id in applied:
+                    results[expense_id] = new_status
+                    count, amount = moved.get(expense['status'], (0, 0))
+                    moved[expense['status']] = (count + 1, amount + company_amount(expense, current_user['company_id']))
+                else:
+                    results[expense_id] = 'not_approvable'
+            
+            if moved:
+                bump_collection_version('expenses', current_user['company_id'])
+                for old_status, (count, amount) in moved.items():
+                    record_status_change(current_user['company_id'], amount, old_status, new_status, count=count)
+                changed = [pending[expense_id] for expense_id in applied]
+                record_bucket_changes(
+                    current_user['company_id'],
+                    removed=changed,
+                    added=[{**expense, 'status': new_status} for expense in changed]
+                )
+        
+        updated = sum(1 for status in results.values() if status == new_status)
+        return jsonify({
+            'message': f'{updated} of {len(expense_ids)} expenses {new_status}',
+            'updated': updated,
+            'results': [
+                {'expense_id': str(expense_id), 'status': results[str(expense_id)]}
+                for expense_id in expense_ids
+            ]
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @expenses_bp.route('/categories', methods=['GET'])
 @jwt_required()
+@static_etag(EXPENSE_CATEGORIES)
 def get_categories():
     return jsonify({'categories': EXPENSE_CATEGORIES}), 200
 
 
 @expenses_bp.route('/currencies', methods=['GET'])
 @jwt_required()
+@static_etag(CURRENCIES)
 def get_currencies():
     return jsonify({'currencies': CURRENCIES}), 200
 
 
 @expenses_bp.route('/payment-methods', methods=['GET'])
 @jwt_required()
+@static_etag(PAYMENT_METHODS)
 def get_payment_methods():
     return jsonify({'payment_methods': PAYMENT_METHODS}), 200
 
 
 @expenses_bp.route('/all', methods=['GET'])
-@jwt_required()
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
+@versioned_etag('expenses')
 def get_all_expenses():
     try:
-        current_user_id = get_jwt_identity()
+        current_user = g.current_user
         
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Check if user is admin
-        if current_user['role'] != 'Admin':
-            return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
-        
-        # Get all expenses for the company
-        expenses = list(mongo.db.expenses.find(
-            {'company_id': current_user['company_id']}
-        ).sort('submitted_at', -1))
-        
-        print(f"Found {len(expenses)} expenses for company {current_user['company_id']}")
+        scope = {'company_id': current_user['company_id']}
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            filters = parse_expense_filters(request.args)
+            # Get one filtered page of the company's expenses
+            expenses, next_cursor = keyset_page(
+                mongo.db.expenses,
+                apply_filters(scope, filters),
+                limit=limit,
+                cursor=request.args.get('cursor')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Facets are opt-in (?facets=1) on the first page and cached until the next expense write
+        facets = None
+        if wants_facets(request.args):
+            facets = cached_facet_counts(mongo.db.expenses, current_user['company_id'], scope, filters)
+        
+        logger.debug("Found %d expenses for company %s", len(expenses), current_user['company_id'])
+        
+        # Resolve every employee and approver on this page with one query
+        users = get_user_map(
+            [expense.get('user_id') for expense in expenses] +
+            [expense.get('approver_id') for expense in expenses],
+            {'name': 1}
+        )
         
         # Get employee and approver details for each expense
+        serialize = get_serializer()
         for expense in expenses:
-            # Convert all ObjectId fields to strings
-            expense['_id'] = str(expense['_id'])
-            expense['user_id'] = str(expense['user_id'])
-            if expense.get('approver_id'):
-                expense['approver_id'] = str(expense['approver_id'])
-            
-            # Convert company_id if it exists
-            if expense.get('company_id'):
-                expense['company_id'] = str(expense['company_id'])
-            
-            # Handle date formatting safely
-            if expense.get('expense_date'):
-                if isinstance(expense['expense_date'], str):
-                    expense['expense_date'] = expense['expense_date']
-                else:
-                    expense['expense_date'] = expense['expense_date'].strftime('%Y-%m-%d')
-            
-            if expense.get('submitted_at'):
-                if isinstance(expense['submitted_at'], str):
-                    expense['submitted_at'] = expense['submitted_at']
-                else:
-                    expense['submitted_at'] = expense['submitted_at'].strftime('%Y-%m-%d %H:%M')
+            employee = users.get(expense.get('user_id'))
+            approver = users.get(expense.get('approver_id'))
             
-            if expense.get('approved_at'):
-                if isinstance(expense['approved_at'], str):
-                    expense['approved_at'] = expense['approved_at']
-                else:
-                    expense['approved_at'] = expense['approved_at'].strftime('%Y-%m-%d %H:%M')
+            # Convert ObjectId fields to strings and format dates
+            serialize(expense)
             
             # Get employee details
-            employee = mongo.db.users.find_one({'_id': ObjectId(expense['user_id'])})
             expense['employee_name'] = employee['name'] if employee else 'Unknown'
             
             # Get approver details
             if expense.get('approver_id') and expense['approver_id'] != 'None':
-                approver = mongo.db.users.find_one({'_id': ObjectId(expense['approver_id'])})
                 expense['approver_name'] = approver['name'] if approver else 'Unknown'
             else:
                 expense['approver_name'] = 'Not Assigned'
         
-        return jsonify({'expenses': expenses}), 200
+        return jsonify({'expenses': expenses, 'next_cursor': next_cursor, 'facets': facets}), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@expenses_bp.route('/team', methods=['GET'])
+@user_required(roles=['Manager', 'Admin'], message='Access denied. Manager privileges required.')
+def get_team_expenses():
+    try:
+        current_user = g.current_user
+        
+        # Every direct and indirect report, from the materialised reporting tree
+        team_ids = get_team_member_ids(current_user['_id'])
+        if not team_ids:
+            return jsonify({'expenses': [], 'next_cursor': None, 'facets': None, 'team_size': 0}), 200
+        
+        # One indexed $in over the team instead of walking the tree
+        scope = {'company_id': current_user['company_id'], 'user_id': {'$in': team_ids}}
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            filters = parse_expense_filters(request.args)
+            expenses, next_cursor = keyset_page(
+                mongo.db.expenses,
+                apply_filters(scope, filters),
+                limit=limit,
+                cursor=request.args.get('cursor')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        facets = None
+        if wants_facets(request.args):
+            facets = cached_facet_counts(mongo.db.expenses, current_user['company_id'], scope, filters)
+        
+        # Resolve every employee and approver on this page with one query
+        users = get_user_map(
+            [expense.get('user_id') for expense in expenses] +
+            [expense.get('approver_id') for expense in expenses],
+            {'name': 1}
+        )
+        
+        serialize = get_serializer()
+        for expense in expenses:
+            employee = users.get(expense.get('user_id'))
+            approver = users.get(expense.get('approver_id'))
+            serialize(expense)
+            expense['employee_name'] = employee['name'] if employee else 'Unknown'
+            expense['approver_name'] = approver['name'] if approver else 'Not Assigned'
+        
+        return jsonify({
+            'expenses': expenses,
+            'next_cursor': next_cursor,
+            'facets': facets,
+            'team_size': len(team_ids)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@expenses_bp.route('/search', methods=['GET'])
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
+def search_company_expenses():
+    try:
+        current_user = g.current_user
+        
+        # Validate query
+        query = (request.args.get('q') or '').strip()
+        if not query:
+            return jsonify({'error': 'q is required'}), 400
+        if len(query) > MAX_SEARCH_QUERY_LENGTH:
+            return jsonify({'error': f'q cannot be longer than {MAX_SEARCH_QUERY_LENGTH} characters'}), 400
+        
+        # Relevance order has no stable keyset, so search pages by offset
+        try:
+            limit = parse_limit(request.args.get('limit'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        try:
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            return jsonify({'error': 'offset must be an integer'}), 400
+        if offset < 0 or offset > MAX_SEARCH_OFFSET:
+            return jsonify({'error': f'offset must be between 0 and {MAX_SEARCH_OFFSET}'}), 400
+        
+        # Ranked matches from the company-scoped text index
+        expenses, has_more = search_expenses(query, {'company_id': current_user['company_id']}, limit, offset)
+        
+        # Resolve every employee on this page with one query
+        users = get_user_map([expense.get('user_id') for expense in expenses], {'name': 1})
+        
+        serialize = get_serializer(SEARCH_PROJECTION)
+        for expense in expenses:
+            employee = users.get(expense.get('user_id'))
+            serialize(expense)
+            expense['employee_name'] = employee['name'] if employee else 'Unknown'
+        
+        return jsonify({
+            'expenses': expenses,
+            'next_offset': offset + limit if has_more else None
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@expenses_bp.route('/export', methods=['GET'])
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
+def export_expenses():
+    try:
+        current_user = g.current_user
+        
+        # Validate export format
+        export_format = request.args.get('format', 'csv').lower()
+        if export_format not in ['csv', 'ndjson']:
+            return jsonify({'error': 'format must be either csv or ndjson'}), 400
+        
+        # Optional submitted_at range (YYYY-MM-DD, end date inclusive)
+        query = {'company_id': current_user['company_id']}
+        try:
+            submitted_range = {}
+            if request.args.get('start_date'):
+                submitted_range['$gte'] = datetime.strptime(request.args['start_date'], '%Y-%m-%d')
+            if request.args.get('end_date'):
+                submitted_range['$lt'] = datetime.strptime(request.args['end_date'], '%Y-%m-%d') + timedelta(days=1)
+            if submitted_range:
+                query['submitted_at'] = submitted_range
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        cursor = mongo.db.expenses.find(query).sort(
+            [('submitted_at', -1), ('_id', -1)]
+        ).batch_size(EXPORT_BATCH_SIZE)
+        
+        if export_format == 'csv':
+            body = _generate_csv(cursor)
+            mimetype = 'text/csv'
+        else:
+            body = _generate_ndjson(cursor)
+            mimetype = 'application/x-ndjson'
+        
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=expenses.{export_format}'}
+        )
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+
+def _export_batches(cursor):
+    """Yield export rows from ``cursor`` one batch at a time.
+
+    Only the current batch and a bounded name cache are held in memory, so the
+    export costs the same memory for ten rows or a million.
+    """
+    names = UserNameCache(maxsize=EXPORT_BATCH_SIZE * 4)
+    serialize = get_serializer()
+    batch = []
+    
+    def flush():
+        names.resolve(
+            [expense.get('user_id') for expense in batch] +
+            [expense.get('approver_id') for expense in batch]
+        )
+        rows = []
+        for expense in batch:
+            employee_name = names.get(expense.get('user_id'), 'Unknown')
+            approver_name = names.get(expense.get('approver_id'), 'Not Assigned')
+            serialize(expense)
+            rows.append(_export_row(expense, employee_name, approver_name))
+        return rows
+    
+    for expense in cursor:
+        batch.append(expense)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield flush()
+            batch = []
+    if batch:
+        yield flush()
+
+
+def _export_row(expense, employee_name, approver_name):
+    return {
+        'id': expense['_id'],
+        'submitted_at': expense.get('submitted_at') or '',
+        'expense_date': expense.get('expense_date') or '',
+        'employee_name': employee_name,
+        'description': expense.get('description', ''),
+        'category': expense.get('category', ''),
+        'amount': expense.get('amount'),
+        'currency': expense.get('currency', ''),
+        'paid_by': expense.get('paid_by', ''),
+        'status': expense.get('status', ''),
+        'approver_name': approver_name,
+        'approved_at': expense.get('approved_at') or '',
+        'remarks': expense.get('remarks', ''),
+        'approval_remarks': expense.get('approval_remarks', '')
+    }
+
+
+def _generate_csv(cursor):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    
+    for rows in _export_batches(cursor):
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def _generate_ndjson(cursor):
+    for rows in _export_batches(cursor):
+        yield ''.join(json.dumps(row) + '\n' for row in rows)
@@ -1,29 +1,30 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, g
 from bson import ObjectId
 from datetime import datetime
+import logging
 from app import mongo
 from app.models import Expense, ApprovalChain
+from app.decorators import user_required
+from app.caching import bump_collection_version, versioned_etag
+from app.analytics import record_bucket_changes
+from app.filters import apply_filters, cached_facet_counts, parse_expense_filters, wants_facets
+from app.currency import company_amount, get_company_currency, to_company_currency
+from app.stats import record_expense_created, record_expense_deleted, record_status_change, record_amount_change
+from app.lookups import get_user_map
+from app.serializers import get_serializer
 
 expenses_bp = Blueprint('expenses', __name__)
 
+logger = logging.getLogger(__name__)
+
 
 @expenses_bp.route('/add', methods=['POST'])
-@jwt_required()
+@user_required(roles=['Employee'], message='Only employees can submit expenses')
 def add_expense():
     try:
-        current_user_id = get_jwt_identity()
+        current_user = g.current_user
         data = request.get_json()
         
-        # Get current user to determine company and role
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Only Employees can add expenses
-        if current_user['role'] != 'Employee':
-            return jsonify({'error': 'Only employees can submit expenses'}), 403
-        
         # Validate required fields
         required_fields = ['description', 'category', 'amount', 'currency', 'expense_date', 'paid_by', 'remarks']
         for field in required_fields:
@@ -64,7 +65,7 @@ def add_expense():
         # Create new expense
         new_expense = Expense(
             company_id=current_user['company_id'],
-            user_id=ObjectId(current_user_id),
+            user_id=current_user['_id'],
             description=description,
             category=category,
             amount=amount,
@@ -72,7 +73,9 @@ def add_expense():
             expense_date=expense_date,
             paid_by=paid_by,
             remarks=remarks,
-            status=status
+            status=status,
+            amount_company=to_company_currency(current_user['company_id'], amount, currency, expense_date),
+            company_currency=get_company_currency(current_user['company_id'])
         )
         
         # If there's an approval chain, set up pending approvals
@@ -85,7 +88,11 @@ def add_expense():
                     'timestamp': None
                 })
         
-        result = mongo.db.expenses.insert_one(new_expense.to_dict())
+        document = new_expense.to_dict()
+        result = mongo.db.expenses.insert_one(document)
+        bump_collection_version('expenses', current_user['company_id'])
+        record_expense_created(current_user['company_id'], new_expense.amount_company, new_expense.status)
+        record_bucket_changes(current_user['company_id'], added=[document])
         
         return jsonify({
             'message': 'Expense submitted successfully',
@@ -98,38 +105,39 @@ def add_expense():
 
 
 @expenses_bp.route('/list', methods=['GET'])
-@jwt_required()
+@user_required()
+@versioned_etag('expenses')
 def list_expenses():
     try:
-        current_user_id = get_jwt_identity()
-        print(f"DEBUG: Fetching expenses for user_id: {current_user_id}")
+        current_user = g.current_user
         
-        # Get current user to determine company and role
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            print(f"DEBUG: User not found for id: {current_user_id}")
-            return jsonify({'error': 'User not found'}), 404
-        
-        print(f"DEBUG: User found - Role: {current_user['role']}, Company: {current_user['company_id']}")
+        # Optional list filters, applied on top of the role-based scope
+        try:
+            filters = parse_expense_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Build query based on user role
         query = {'company_id': current_user['company_id']}
         
         if current_user['role'] == 'Employee':
             # Employees can only see their own expenses
-            query['user_id'] = ObjectId(current_user_id)
-            print(f"DEBUG: Employee query: {query}")
+            query['user_id'] = current_user['_id']
+            scope = query
+            query = apply_filters(query, filters)
+            logger.debug("Employee query: %s", query)
             expenses = list(mongo.db.expenses.find(query).sort('created_at', -1))
-            print(f"DEBUG: Found {len(expenses)} expenses for employee")
+            logger.debug("Found %d expenses for employee", len(expenses))
         elif current_user['role'] == 'Manager':
             # Managers can see their own expenses and expenses waiting for their approval
-            manager_expenses = list(mongo.db.expenses.find({
+            own_query = {
                 'company_id': current_user['company_id'],
-                'user_id': ObjectId(current_user_id)
-            }))
+                'user_id': current_user['_id']
+            }
+            manager_expenses = list(mongo.db.expenses.find(apply_filters(own_query, filters)))
             
             # Find expenses waiting for manager approval
-            pending_approvals = list(mongo.db.expenses.find({
+            approval_query = {
                 'company_id': current_user['company_id'],
                 'approvals': {
                     '$elemMatch': {
@@ -137,7 +145,15 @@ def list_expenses():
                         'status': 'Pending'
                     }
                 }
-            }))
+            }
+            pending_approvals = list(mongo.db.expenses.find(apply_filters(approval_query, filters)))
+            scope = {
+                'company_id': current_user['company_id'],
+                '$or': [
+                    {'user_id': current_user['_id']},
+                    {'approvals': approval_query['approvals']}
+                ]
+            }
             
             # Combine both lists
             all_expenses = manager_expenses + pending_approvals
@@ -152,95 +168,63 @@ def list_expenses():
             expenses = unique_expenses
         else:  # Admin
             # Admin can see all company expenses
-            print(f"DEBUG: Admin query: {query}")
+            scope = query
+            query = apply_filters(query, filters)
+            logger.debug("Admin query: %s", query)
             expenses = list(mongo.db.expenses.find(query).sort('created_at', -1))
-            print(f"DEBUG: Found {len(expenses)} expenses for admin")
+            logger.debug("Found %d expenses for admin", len(expenses))
         
         # Convert ObjectId to string and add user information
         if expenses is None:
             expenses = []
         
-        for i, expense in enumerate(expenses):
+        # Resolve every submitter in the result with one query
+        users = get_user_map(expense.get('user_id') for expense in expenses)
+        
+        serialize = get_serializer(style='iso')
+        for expense in expenses:
             try:
-                print(f"DEBUG: Processing expense {i+1}: {expense.get('description', 'Unknown')}")
-                expense['_id'] = str(expense['_id'])
-                expense['company_id'] = str(expense['company_id'])
-                expense['user_id'] = str(expense['user_id'])
-                
-                # Handle expense_date conversion safely
-                if expense.get('expense_date'):
-                    if isinstance(expense['expense_date'], datetime):
-                        expense['expense_date'] = expense['expense_date'].isoformat()
-                    elif isinstance(expense['expense_date'], str):
-                        # Already a string, keep as is
-                        pass
-                    else:
-                        # Convert to string if it's some other type
-                        expense['expense_date'] = str(expense['expense_date'])
-                else:
-                    expense['expense_date'] = None
+                user = users.get(expense.get('user_id'))
                 
-                # Handle created_at conversion safely
-                if expense.get('created_at'):
-                    if isinstance(expense['created_at'], datetime):
-                        expense['created_at'] = expense['created_at'].isoformat()
-                    elif isinstance(expense['created_at'], str):
-                        # Already a string, keep as is
-                        pass
-                    else:
-                        # Convert to string if it's some other type
-                        expense['created_at'] = str(expense['created_at'])
-                else:
-                    expense['created_at'] = None
-                
-                # Convert approval timestamps
-                for approval in expense.get('approvals', []):
-                    if approval.get('timestamp') and isinstance(approval['timestamp'], datetime):
-                        approval['timestamp'] = approval['timestamp'].isoformat()
-                    if approval.get('user_id'):
-                        approval['user_id'] = str(approval['user_id'])
+                # Convert ObjectIds, dates and approval timestamps
+                serialize(expense)
                 
                 # Get user information
-                user = mongo.db.users.find_one({'_id': ObjectId(expense['user_id'])})
                 if user:
                     expense['user_name'] = user['name']
                     expense['user_email'] = user['email']
                 else:
                     expense['user_name'] = 'Unknown User'
                     expense['user_email'] = 'Unknown Email'
-                    
-                print(f"DEBUG: Successfully processed expense {i+1}")
-            except Exception as e:
-                print(f"ERROR: Failed to process expense {i+1}: {str(e)}")
-                print(f"ERROR: Expense data: {expense}")
+            except Exception:
+                # Log the id only: the document can hold personal data
+                logger.exception("Failed to serialize expense %s", expense.get('_id'))
                 # Skip this expense or set default values
                 expense['user_name'] = 'Error'
                 expense['user_email'] = 'Error'
                 expense['expense_date'] = None
                 expense['created_at'] = None
         
-        return jsonify({'expenses': expenses}), 200
+        facets = None
+        if wants_facets(request.args):
+            facets = cached_facet_counts(mongo.db.expenses, current_user['company_id'], scope, filters)
+        
+        return jsonify({
+            'expenses': expenses,
+            'facets': facets
+        }), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @expenses_bp.route('/approve/<expense_id>', methods=['PUT'])
-@jwt_required()
+@user_required(roles=['Manager', 'Director'], message='Only managers and directors can approve expenses')
 def approve_expense(expense_id):
     try:
-        current_user_id = get_jwt_identity()
+        current_user = g.current_user
         data = request.get_json()
         
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Only Managers and Directors can approve
-        if current_user['role'] not in ['Manager', 'Director']:
-            return jsonify({'error': 'Only managers and directors can approve expenses'}), 403
-        
         # Validate required fields
         if 'action' not in data:
             return jsonify({'error': 'action is required (approve/reject)'}), 400
@@ -274,8 +258,9 @@ def approve_expense(expense_id):
             return jsonify({'error': 'You cannot approve this expense'}), 403
         
         # Update the approval
+        old_status = expense['status']
         new_status = 'Approved' if action == 'approve' else 'Rejected'
-        expense['approvals'][approval_index]['user_id'] = ObjectId(current_user_id)
+        expense['approvals'][approval_index]['user_id'] = current_user['_id']
         expense['approvals'][approval_index]['status'] = new_status
         expense['approvals'][approval_index]['timestamp'] = datetime.utcnow()
         
@@ -288,14 +273,20 @@ def approve_expense(expense_id):
         else:
             expense['status'] = 'Pending'
         
-        # Update the expense
-        mongo.db.expenses.update_one(
-            {'_id': ObjectId(expense_id)},
+        # Update the expense, unless another approver changed it since it was read
+        result = mongo.db.expenses.update_one(
+            {'_id': ObjectId(expense_id), 'status': old_status},
             {'$set': {
                 'approvals': expense['approvals'],
                 'status': expense['status']
             }}
         )
+        if result.matched_count == 0:
+            return jsonify({'error': 'Expense was modified by another request. Please retry.'}), 409
+        
+        bump_collection_version('expenses', current_user['company_id'])
+        record_status_change(current_user['company_id'], company_amount(expense, current_user['company_id']), old_status, expense['status'])
+        record_bucket_changes(current_user['company_id'], removed=[{**expense, 'status': old_status}], added=[expense])
         
         return jsonify({
             'message': f'Expense {action}d successfully',
@@ -307,17 +298,12 @@ def approve_expense(expense_id):
 
 
 @expenses_bp.route('/update/<expense_id>', methods=['PUT'])
-@jwt_required()
+@user_required()
 def update_expense(expense_id):
     try:
-        current_user_id = get_jwt_identity()
+        current_user = g.current_user
         data = request.get_json()
         
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
         # Find the expense
         expense = mongo.db.expenses.find_one({'_id': ObjectId(expense_id)})
         if not expense:
@@ -332,7 +318,7 @@ def update_expense(expense_id):
         if current_user['role'] == 'Admin':
             can_edit = True
         elif (current_user['role'] == 'Employee' and 
-              expense['user_id'] == ObjectId(current_user_id) and 
+              expense['user_id'] == current_user['_id'] and 
               expense['status'] in ['Draft', 'Submitted']):
             can_edit = True
         
@@ -369,11 +355,27 @@ def update_expense(expense_id):
         if not update_data:
             return jsonify({'error': 'No valid fields to update'}), 400
         
+        # Re-convert to company currency when the amount, currency or date changes
+        old_amount_company = company_amount(expense, current_user['company_id'])
+        if {'amount', 'currency', 'expense_date'} & update_data.keys():
+            update_data['amount_company'] = to_company_currency(
+                current_user['company_id'],
+                update_data.get('amount', expense['amount']),
+                update_data.get('currency', expense['currency']),
+                update_data.get('expense_date', expense.get('expense_date'))
+            )
+            update_data['company_currency'] = get_company_currency(current_user['company_id'])
+        
         # Update the expense
         mongo.db.expenses.update_one(
             {'_id': ObjectId(expense_id)},
             {'$set': update_data}
         )
+        bump_collection_version('expenses', current_user['company_id'])
+        if 'amount_company' in update_data:
+            record_amount_change(current_user['company_id'], expense['status'], update_data['amount_company'] - old_amount_company)
+        if {'amount_company', 'category'} & update_data.keys():
+            record_bucket_changes(current_user['company_id'], removed=[expense], added=[{**expense, **update_data}])
         
         return jsonify({'message': 'Expense updated successfully'}), 200
     
@@ -382,15 +384,10 @@ def update_expense(expense_id):
 
 
 @expenses_bp.route('/delete/<expense_id>', methods=['DELETE'])
-@jwt_required()
+@user_required()
 def delete_expense(expense_id):
     try:
-        current_user_id = get_jwt_identity()
-        
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
+        current_user = g.current_user
         
         # Find the expense
         expense = mongo.db.expenses.find_one({'_id': ObjectId(expense_id)})
@@ -406,7 +403,7 @@ def delete_expense(expense_id):
         if current_user['role'] == 'Admin':
             can_delete = True
         elif (current_user['role'] == 'Employee' and 
-              expense['user_id'] == ObjectId(current_user_id) and 
+              expense['user_id'] == current_user['_id'] and 
               expense['status'] not in ['Approved', 'Rejected']):
             can_delete = True
         
@@ -414,7 +411,11 @@ def delete_expense(expense_id):
             return jsonify({'error': 'You cannot delete this expense'}), 403
         
         # Delete the expense
-        mongo.db.expenses.delete_one({'_id': ObjectId(expense_id)})
+        result = mongo.db.expenses.delete_one({'_id': ObjectId(expense_id)})
+        bump_collection_version('expenses', current_user['company_id'])
+        if result.deleted_count:
+            record_expense_deleted(current_user['company_id'], company_amount(expense, current_user['company_id']), expense['status'])
+            record_bucket_changes(current_user['company_id'], removed=[expense])
         
         return jsonify({'message': 'Expense deleted successfully'}), 200
     
@@ -1,71 +1,94 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from flask_mail import Message
+from flask import Blueprint, request, jsonify, g
 from bson import ObjectId
+import re
 import string
 import random
-from app import mongo, mail
+from app import mongo
 from app.models import User
+from app.hashing import HashingBusy
+from app.outbox import enqueue_mail
+from app.lookups import get_user_map
+from app.pagination import keyset_page, parse_limit
+from app.org import ancestors_of, refresh_ancestors, set_manager
+from app.decorators import user_required, invalidate_token_version
 
 users_bp = Blueprint('users', __name__)
 
+VALID_ROLES = ['Admin', 'Manager', 'Employee']
+
+# Fields returned by /users/list
+USER_LIST_PROJECTION = {'name': 1, 'email': 1, 'role': 1, 'manager_id': 1, 'company_id': 1, 'created_at': 1}
+
+# Longest prefix accepted by /users/list?q=
+MAX_USER_SEARCH_LENGTH = 100
+
 
 @users_bp.route('/list', methods=['GET'])
-@jwt_required()
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
 def list_users():
     try:
-        current_user_id = get_jwt_identity()
-        
-        # Get current user to determine company
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Check if user is admin
-        if current_user['role'] != 'Admin':
-            return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
+        current_user = g.current_user
+        
+        query = {'company_id': current_user['company_id']}
+        
+        # Optional role filter (comma separated)
+        if request.args.get('role'):
+            roles = [role.strip() for role in request.args['role'].split(',') if role.strip()]
+            invalid = [role for role in roles if role not in VALID_ROLES]
+            if invalid:
+                return jsonify({'error': f'Role must be one of: {VALID_ROLES}'}), 400
+            query['role'] = roles[0] if len(roles) == 1 else {'$in': roles}
+        
+        # Optional case-insensitive name/email prefix search. Each $or branch is an
+        # anchored range scan on its own index (company_name_lower, company_email_lower),
+        # but the merged matches are sorted by name in memory, so very short
+        # prefixes in large companies cost a sort over every match
+        search = (request.args.get('q') or '').strip().lower()
+        if len(search) > MAX_USER_SEARCH_LENGTH:
+            return jsonify({'error': f'q cannot be longer than {MAX_USER_SEARCH_LENGTH} characters'}), 400
+        if search:
+            prefix = {'$regex': '^' + re.escape(search)}
+            query['$or'] = [{'name_lower': prefix}, {'email_lower': prefix}]
+        
+        # Get one page of the company's users, ordered by name
+        try:
+            users, next_cursor = keyset_page(
+                mongo.db.users,
+                query,
+                USER_LIST_PROJECTION,
+                limit=parse_limit(request.args.get('limit')),
+                cursor=request.args.get('cursor'),
+                direction=1,
+                sort_field='name'
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Get all users in the same company
-        users = list(mongo.db.users.find(
-            {'company_id': current_user['company_id']},
-            {'password_hash': 0}  # Exclude password hash
-        ))
+        # Resolve every manager on this page with one query
+        managers = get_user_map([user.get('manager_id') for user in users], {'name': 1})
         
-        # Convert ObjectId to string and get manager names
+        # Convert ObjectId to string and add manager names
         for user in users:
             user['_id'] = str(user['_id'])
             user['company_id'] = str(user['company_id'])
-            
-            # Get manager name if manager_id exists
+            manager = managers.get(user.get('manager_id'))
+            user['manager_name'] = manager['name'] if manager else None
             if user.get('manager_id'):
-                manager = mongo.db.users.find_one({'_id': user['manager_id']})
-                user['manager_name'] = manager['name'] if manager else None
                 user['manager_id'] = str(user['manager_id'])
-            else:
-                user['manager_name'] = None
         
-        return jsonify({'users': users}), 200
+        return jsonify({'users': users, 'next_cursor': next_cursor}), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @users_bp.route('/create', methods=['POST'])
-@jwt_required()
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
 def create_user():
     try:
-        current_user_id = get_jwt_identity()
+        current_user = g.current_user
         data = request.get_json()
         
-        # Get current user to determine company
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Check if user is admin
-        if current_user['role'] != 'Admin':
-            return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
-        
         # Validate required fields
         required_fields = ['name', 'email', 'password', 'role']
         for field in required_fields:
@@ -89,22 +112,24 @@ def create_user():
             return jsonify({'error': 'User with this email already exists'}), 400
         
         # Validate manager if provided
+        manager = None
         if manager_id:
             manager = mongo.db.users.find_one({
                 '_id': ObjectId(manager_id),
                 'company_id': current_user['company_id']
-            })
+            }, {'ancestors': 1})
             if not manager:
                 return jsonify({'error': 'Invalid manager ID'}), 400
         
-        # Create new user
+        # Create new user, placed in the reporting tree under the manager
         new_user = User(
             company_id=current_user['company_id'],
             name=name,
             email=email,
             password=password,
             role=role,
-            manager_id=ObjectId(manager_id) if manager_id else None
+            manager_id=ObjectId(manager_id) if manager_id else None,
+            ancestors=ancestors_of(manager)
         )
         
         result = mongo.db.users.insert_one(new_user.to_dict())
@@ -114,26 +139,19 @@ def create_user():
             'user_id': str(result.inserted_id)
         }), 201
     
+    except HashingBusy:
+        return jsonify({'error': 'Server is busy, please try again'}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @users_bp.route('/update-role', methods=['PUT'])
-@jwt_required()
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
 def update_role():
     try:
-        current_user_id = get_jwt_identity()
+        current_user = g.current_user
         data = request.get_json()
         
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Check if user is admin
-        if current_user['role'] != 'Admin':
-            return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
-        
         # Validate required fields
         if 'user_id' not in data or 'new_role' not in data:
             return jsonify({'error': 'user_id and new_role are required'}), 400
@@ -154,11 +172,15 @@ def update_role():
         if not target_user:
             return jsonify({'error': 'User not found or not in your company'}), 404
         
-        # Update role
+        # Update role and revoke tokens carrying the old role
         mongo.db.users.update_one(
             {'_id': ObjectId(user_id)},
-            {'$set': {'role': new_role}}
+            {'$set': {'role': new_role}, '$inc': {'token_version': 1}}
         )
+        invalidate_token_version(user_id)
+        
+        # Reporting lines do not change with the role; this fills in ancestors for older users
+        refresh_ancestors(ObjectId(user_id))
         
         return jsonify({'message': 'User role updated successfully'}), 200
     
@@ -167,21 +189,12 @@ def update_role():
 
 
 @users_bp.route('/assign-manager', methods=['PUT'])
-@jwt_required()
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
 def assign_manager():
     try:
-        current_user_id = get_jwt_identity()
+        current_user = g.current_user
         data = request.get_json()
         
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Check if user is admin
-        if current_user['role'] != 'Admin':
-            return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
-        
         # Validate required fields
         if 'user_id' not in data:
             return jsonify({'error': 'user_id is required'}), 400
@@ -210,12 +223,15 @@ def assign_manager():
             if manager_id == user_id:
                 return jsonify({'error': 'User cannot be their own manager'}), 400
         
-        # Update manager
-        update_data = {'manager_id': ObjectId(manager_id) if manager_id else None}
-        mongo.db.users.update_one(
-            {'_id': ObjectId(user_id)},
-            {'$set': update_data}
-        )
+        # Update manager and move the user's whole subtree in the reporting tree
+        try:
+            set_manager(ObjectId(user_id), ObjectId(manager_id) if manager_id else None)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Revoke tokens carrying the old manager
+        mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$inc': {'token_version': 1}})
+        invalidate_token_version(user_id)
         
         return jsonify({'message': 'Manager assigned successfully'}), 200
     
@@ -224,15 +240,10 @@ def assign_manager():
 
 
 @users_bp.route('/managers', methods=['GET'])
-@jwt_required()
+@user_required()
 def get_managers():
     try:
-        current_user_id = get_jwt_identity()
-        
-        # Get current user to determine company
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
+        current_user = g.current_user
         
         # Get all managers and admins in the same company
         managers = list(mongo.db.users.find(
@@ -254,21 +265,12 @@ def get_managers():
 
 
 @users_bp.route('/generate-password', methods=['POST'])
-@jwt_required()
+@user_required(roles=['Admin'], message='Access denied. Admin privileges required.')
 def generate_password():
     try:
-        current_user_id = get_jwt_identity()
+        current_user = g.current_user
         data = request.get_json()
         
-        # Get current user
-        current_user = mongo.db.users.find_one({'_id': ObjectId(current_user_id)})
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Check if user is admin
-        if current_user['role'] != 'Admin':
-            return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
-        
         # Validate required fields
         if 'user_id' not in data:
             return jsonify({'error': 'user_id is required'}), 400
@@ -291,19 +293,19 @@ def generate_password():
         hashed_password = User.set_password(new_password)
         mongo.db.users.update_one(
             {'_id': ObjectId(user_id)},
-            {'$set': {'password_hash': hashed_password}}
+            {'$set': {'password_hash': hashed_password}, '$inc': {'token_version': 1}}
         )
+        invalidate_token_version(user_id)
         
-        # Try sending email, fallback to console if email fails
-        try:
-            # Get company info for email
-            company = mongo.db.companies.find_one({'_id': current_user['company_id']})
-            company_name = company['name'] if company else 'Your Company'
-            
-            msg = Message(
-                subject=f'New Password - {company_name}',
-                recipients=[target_user['email']],
-                body=f'''
+        # Get company info for email
+        company = mongo.db.companies.find_one({'_id': current_user['company_id']}, {'name': 1})
+        company_name = company['name'] if company else 'Your Company'
+        
+        # Queue the email; the outbox workers deliver and retry it in the background
+        enqueue_mail(
+            f'New Password - {company_name}',
+            [target_user['email']],
+            f'''
 Hello {target_user['name']},
 
 A new password has been generated for your account by your administrator.
@@ -319,26 +321,13 @@ Company: {company_name}
 Best regards,
 {company_name} Admin Team
                 '''
-            )
-            
-            mail.send(msg)
-            
-            return jsonify({
-                'message': f'New password has been generated and sent to {target_user["email"]}'
-            }), 200
-            
-        except Exception as email_error:
-            # If email fails, log to console as fallback
-            print("=" * 60)
-            print(f"🔑 EMAIL FAILED - NEW PASSWORD FOR: {target_user['email']}")
-            print(f"🔑 NEW PASSWORD: {new_password}")
-            print(f"🔑 EMAIL ERROR: {email_error}")
-            print("=" * 60)
-            
-            return jsonify({
-                'message': f'New password generated for {target_user["name"]}. Check the server console for the password.',
-                'note': 'Email service temporarily unavailable.'
-            }), 200
+        )
+        
+        return jsonify({
+            'message': f'New password has been generated and sent to {target_user["email"]}'
+        }), 200
     
+    except HashingBusy:
+        return jsonify({'error': 'Server is busy, please try again'}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
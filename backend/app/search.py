@@ -0,0 +1,102 @@
+import re
+from app import mongo
+
+# Fields covered by the expenses text index, in the order snippets are built
+SEARCH_FIELDS = ('description', 'remarks', 'category')
+
+# Characters of context kept on each side of the first match in a snippet
+SNIPPET_CONTEXT = 40
+
+# Fields returned with each search hit
+SEARCH_PROJECTION = {
+    '_id': 1, 'user_id': 1, 'description': 1, 'category': 1, 'amount': 1, 'currency': 1,
+    'expense_date': 1, 'status': 1, 'remarks': 1, 'submitted_at': 1,
+    'score': {'$meta': 'textScore'}
+}
+
+_TERM_PATTERN = re.compile(r'"([^"]+)"|(-?)([\w\'-]+)', re.UNICODE)
+
+# Suffixes dropped so highlights follow the index's stemming closely enough
+_SUFFIXES = ('ing', 'es', 'ed', 's')
+
+
+def search_terms(query):
+    """Words and quoted phrases a ``$text`` query matches on (negated words excluded)."""
+    terms = []
+    for phrase, negated, word in _TERM_PATTERN.findall(query):
+        if phrase:
+            terms.append(phrase.strip())
+        elif not negated:
+            terms.append(word)
+    return [term for term in terms if term]
+
+
+def _stem(term):
+    lowered = term.lower()
+    for suffix in _SUFFIXES:
+        if len(lowered) > len(suffix) + 2 and lowered.endswith(suffix):
+            return lowered[:-len(suffix)]
+    return lowered
+
+
+def _highlight_pattern(terms):
+    # Match each term (or its stem) at a word start, up to the end of the word
+    alternatives = sorted({re.escape(_stem(term)) for term in terms}, key=len, reverse=True)
+    return re.compile(r'\b(?:' + '|'.join(alternatives) + r')\w*', re.IGNORECASE)
+
+
+def build_snippets(expense, pattern):
+    """Snippets for each searched field that contains a match.
+
+    Returns ``[{field, text, highlights}]`` where ``highlights`` are
+    ``[start, end]`` offsets into ``text``, so clients can mark them up
+    without the server emitting HTML.
+    """
+    snippets = []
+    for field in SEARCH_FIELDS:
+        value = expense.get(field)
+        if not isinstance(value, str):
+            continue
+        matches = list(pattern.finditer(value))
+        if not matches:
+            continue
+
+        start = max(matches[0].start() - SNIPPET_CONTEXT, 0)
+        end = min(matches[0].end() + SNIPPET_CONTEXT, len(value))
+        prefix = '…' if start > 0 else ''
+        suffix = '…' if end < len(value) else ''
+        offset = len(prefix) - start
+        snippets.append({
+            'field': field,
+            'text': prefix + value[start:end] + suffix,
+            'highlights': [
+                [match.start() + offset, min(match.end(), end) + offset]
+                for match in matches
+                if match.start() >= start and match.start() < end
+            ]
+        })
+    return snippets
+
+
+def search_expenses(query, scope, limit, offset=0):
+    """Rank a company's expenses against ``query`` with the text index.
+
+    ``scope`` must include ``company_id`` (the equality prefix of the
+    compound text index). Returns ``(hits, has_more)``, best matches first,
+    each hit carrying its ``score`` and ``snippets``.
+    """
+    cursor = mongo.db.expenses.find(
+        {**scope, '$text': {'$search': query}},
+        SEARCH_PROJECTION
+    ).sort([('score', {'$meta': 'textScore'}), ('_id', -1)]).skip(offset).limit(limit + 1)
+
+    hits = list(cursor)
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+
+    terms = search_terms(query)
+    pattern = _highlight_pattern(terms) if terms else None
+    for hit in hits:
+        hit['score'] = round(hit['score'], 4)
+        hit['snippets'] = build_snippets(hit, pattern) if pattern else []
+    return hits, has_more
@@ -0,0 +1,93 @@
+from datetime import datetime
+from functools import lru_cache
+from bson import ObjectId
+
+# Expense fields that need converting before jsonify, by kind
+ID_FIELDS = ('_id', 'company_id', 'user_id', 'approver_id')
+DATE_FIELDS = ('expense_date',)
+DATETIME_FIELDS = ('submitted_at', 'approved_at', 'created_at')
+
+# Output styles: 'display' matches the formats the React pages show,
+# 'iso' keeps full ISO 8601 timestamps
+STYLES = ('display', 'iso')
+
+
+def _convert_id(value):
+    if value.__class__ is ObjectId:
+        return str(value)
+    return value
+
+
+def _display_date(value):
+    if value.__class__ is datetime:
+        return f"{value.year:04d}-{value.month:02d}-{value.day:02d}"
+    return value
+
+
+def _display_datetime(value):
+    if value.__class__ is datetime:
+        return f"{value.year:04d}-{value.month:02d}-{value.day:02d} {value.hour:02d}:{value.minute:02d}"
+    return value
+
+
+def _iso_datetime(value):
+    if value.__class__ is datetime:
+        return value.isoformat()
+    return value
+
+
+def _convert_approvals(approvals):
+    for approval in approvals:
+        if approval.get('timestamp').__class__ is datetime:
+            approval['timestamp'] = approval['timestamp'].isoformat()
+        if approval.get('user_id') is not None:
+            approval['user_id'] = str(approval['user_id'])
+    return approvals
+
+
+def _converters(style):
+    date_converter = _display_date if style == 'display' else _iso_datetime
+    datetime_converter = _display_datetime if style == 'display' else _iso_datetime
+
+    converters = {field: _convert_id for field in ID_FIELDS}
+    converters.update({field: date_converter for field in DATE_FIELDS})
+    converters.update({field: datetime_converter for field in DATETIME_FIELDS})
+    converters['approvals'] = _convert_approvals
+    return converters
+
+
+@lru_cache(maxsize=64)
+def _field_plan(fields, style):
+    converters = _converters(style)
+    if fields is None:
+        return tuple(converters.items())
+    # _id is always returned unless explicitly excluded, so keep it in the plan
+    return tuple((field, converters[field]) for field in converters if field in fields or field == '_id')
+
+
+def get_serializer(projection=None, style='display'):
+    """Return a function that makes an expense document JSON-ready in place.
+
+    The field plan (which fields to convert and how) is worked out once per
+    projection and style and cached, so serializing a row is a single pass
+    over a precomputed tuple with no per-field branching on the schema.
+    Values that are already strings, or missing, are left untouched.
+    """
+    if style not in STYLES:
+        raise ValueError(f'style must be one of: {STYLES}')
+
+    fields = None
+    if projection is not None:
+        # Exclusion-only projections return every field
+        fields = frozenset(field for field, include in projection.items() if include) or None
+
+    plan = _field_plan(fields, style)
+
+    def serialize(expense):
+        for field, convert in plan:
+            value = expense.get(field)
+            if value is not None:
+                expense[field] = convert(value)
+        return expense
+
+    return serialize
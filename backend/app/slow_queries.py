@@ -0,0 +1,327 @@
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from flask import g, has_request_context, request
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid, PyMongoError
+from app import mongo
+
+logger = logging.getLogger(__name__)
+
+# Slow-operation log kept in the capped slow_queries collection:
+#   {ts, company_id, route, method, database, collection, command, outcome,
+#    duration_ms, filter, sort, plan: {stage, stages, indexes, collscan,
+#    docs_examined, keys_examined, n_returned, execution_ms}, explain_error}
+# filter and sort keep the query shape with every value replaced by its type
+# name, so the log shows what was asked without storing user data. The
+# listener only queues commands over SLOW_QUERY_MS; a background thread runs
+# explain() and writes the entry, so request threads never wait on either.
+
+SLOW_QUERY_COLLECTION = 'slow_queries'
+
+# Commands explain() accepts, mapped to the field holding their filter
+FILTER_FIELDS = {
+    'find': 'filter',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query',
+    'aggregate': 'pipeline',
+    'update': 'updates',
+    'delete': 'deletes'
+}
+
+# Commands whose collection is not the value of the command name field
+_COLLECTION_FIELDS = {'getMore': 'collection'}
+
+# Driver and session fields stripped before a command is explained
+_SESSION_FIELDS = {
+    'lsid', 'txnNumber', 'autocommit', 'startTransaction', 'readConcern', 'writeConcern',
+    '$db', '$clusterTime', '$readPreference'
+}
+
+# Pipeline stages that write, so the aggregation is never re-run by explain
+_WRITE_STAGES = {'$out', '$merge'}
+
+# Distinct value shapes kept per list (an $in of 500 ids is one ObjectId)
+_MAX_LIST_SHAPES = 5
+
+# Query shapes whose explained plan is remembered between explains
+_MAX_CACHED_PLANS = 1000
+
+
+def query_shape(value):
+    """``value`` with every scalar replaced by its type name."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+            if len(shapes) >= _MAX_LIST_SHAPES:
+                break
+        return shapes
+    return type(value).__name__
+
+
+def _command_filter(command_name, command):
+    value = command.get(FILTER_FIELDS.get(command_name, ''))
+    if command_name in ('update', 'delete'):
+        # Bulk writes carry one statement per operation; the first one stands in for the batch
+        value = value[0].get('q') if value else None
+    return value
+
+
+def _explain_command(command_name, command, max_time_ms):
+    """The command to pass to explain, or None if it cannot be explained safely."""
+    if command_name not in FILTER_FIELDS:
+        return None
+    inner = {key: value for key, value in command.items() if key not in _SESSION_FIELDS}
+    if command_name == 'aggregate':
+        if any(set(stage) & _WRITE_STAGES for stage in inner.get('pipeline', [])):
+            return None
+    if command_name in ('update', 'delete'):
+        statements = inner.get(command_name + 's') or []
+        inner[command_name + 's'] = statements[:1]
+    elif command_name != 'findAndModify':
+        # Bound the re-run: a collection scan is the case we most want to explain
+        inner['maxTimeMS'] = max_time_ms
+    return inner
+
+
+def _planner_section(explain):
+    # find/count/distinct report at the top level; aggregations that are not
+    # fully pushed down into the query layer report under their $cursor stage
+    if 'queryPlanner' in explain:
+        return explain
+    for stage in explain.get('stages', []):
+        if '$cursor' in stage:
+            return stage['$cursor']
+    return {}
+
+
+def _walk_plan(node, stages, indexes):
+    if not isinstance(node, dict):
+        return
+    # Slot-based engine plans nest the classic tree under queryPlan
+    node = node.get('queryPlan', node)
+    if node.get('stage'):
+        stages.append(node['stage'])
+    if node.get('indexName') and node['indexName'] not in indexes:
+        indexes.append(node['indexName'])
+    _walk_plan(node.get('inputStage'), stages, indexes)
+    for child in node.get('inputStages', []):
+        _walk_plan(child, stages, indexes)
+
+
+def summarize_explain(explain):
+    """Reduce explain() output to the winning plan's stages, indexes and counts."""
+    section = _planner_section(explain)
+    stages, indexes = [], []
+    _walk_plan(section.get('queryPlanner', {}).get('winningPlan'), stages, indexes)
+    stats = section.get('executionStats', {})
+    return {
+        'stage': ' > '.join(stages),
+        'stages': stages,
+        'indexes': indexes,
+        'collscan': 'COLLSCAN' in stages,
+        'docs_examined': stats.get('totalDocsExamined'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'n_returned': stats.get('nReturned'),
+        'execution_ms': stats.get('executionTimeMillis')
+    }
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Hand commands slower than the threshold to the recorder."""
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        # (connection, request id) -> (command, route, method, company_id), between started and finished
+        self._inflight = {}
+
+    def started(self, event):
+        if self.recorder.is_recorder_thread() or event.command_name == 'explain':
+            return
+        route = method = company_id = None
+        if has_request_context():
+            route = request.url_rule.rule if request.url_rule else request.path
+            method = request.method
+            current_user = g.get('current_user')
+            if current_user:
+                company_id = current_user.get('company_id')
+        self._inflight[(event.connection_id, event.request_id)] = (event.command, route, method, company_id)
+
+    def _finished(self, event, outcome):
+        context = self._inflight.pop((event.connection_id, event.request_id), None)
+        if context is not None and event.duration_micros >= self.recorder.threshold_micros:
+            self.recorder.submit(event, outcome, *context)
+
+    def succeeded(self, event):
+        self._finished(event, 'success')
+
+    def failed(self, event):
+        self._finished(event, 'failure')
+
+
+class SlowQueryRecorder:
+    """Sample slow MongoDB commands and their explain plans into a capped collection.
+
+    Slow commands are queued (up to ``SLOW_QUERY_QUEUE_SIZE``; further ones
+    are dropped) for one background thread, which explains each query shape
+    at most once per ``SLOW_QUERY_EXPLAIN_INTERVAL`` seconds and reuses that
+    plan for repeats in between.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.threshold_micros = 0
+        self.listener = SlowQueryListener(self)
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # shape key -> (explained at, plan summary, explain error)
+        self._plans = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('SLOW_QUERY_MS', 100)
+        app.config.setdefault('SLOW_QUERY_SAMPLE_RATE', 1.0)
+        app.config.setdefault('SLOW_QUERY_EXPLAIN_INTERVAL', 60)
+        app.config.setdefault('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', 5000)
+        app.config.setdefault('SLOW_QUERY_QUEUE_SIZE', 100)
+        app.config.setdefault('SLOW_QUERY_LOG_BYTES', 16 * 1024 * 1024)
+        self.threshold_micros = app.config['SLOW_QUERY_MS'] * 1000
+        self._queue = queue.Queue(maxsize=app.config['SLOW_QUERY_QUEUE_SIZE'])
+        app.extensions['slow_queries'] = self
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.threshold_micros > 0
+
+    def is_recorder_thread(self):
+        # The recorder's own explain and insert commands are never recorded
+        return getattr(self._local, 'recording', False)
+
+    def submit(self, event, outcome, command, route, method, company_id):
+        command_name = event.command_name
+        field = _COLLECTION_FIELDS.get(command_name, command_name)
+        collection = command.get(field)
+        if not isinstance(collection, str) or collection == SLOW_QUERY_COLLECTION:
+            return
+        if random.random() >= self.app.config['SLOW_QUERY_SAMPLE_RATE']:
+            return
+
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait({
+                'ts': datetime.utcnow(),
+                'company_id': company_id,
+                'route': route,
+                'method': method,
+                'database': event.database_name,
+                'collection': collection,
+                'command': command_name,
+                'outcome': outcome,
+                'duration_ms': round(event.duration_micros / 1000, 3),
+                '_command': command
+            })
+        except queue.Full:
+            pass
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slow-query-recorder', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        self._local.recording = True
+        with self.app.app_context():
+            self._ensure_collection()
+            while True:
+                entry = self._queue.get()
+                try:
+                    self._record(entry)
+                except Exception as e:
+                    logger.warning("Slow query recorder error: %s", e)
+
+    def _ensure_collection(self):
+        try:
+            mongo.db.create_collection(
+                SLOW_QUERY_COLLECTION, capped=True, size=self.app.config['SLOW_QUERY_LOG_BYTES']
+            )
+        except CollectionInvalid:
+            pass
+        except PyMongoError as e:
+            logger.warning("Could not create the %s collection: %s", SLOW_QUERY_COLLECTION, e)
+
+    def _record(self, entry):
+        command = entry.pop('_command')
+        command_name = entry['command']
+        entry['filter'] = query_shape(_command_filter(command_name, command))
+        entry['sort'] = query_shape(command.get('sort')) if command.get('sort') else None
+        entry['plan'], entry['explain_error'] = self._plan_for(entry, command)
+        mongo.db[SLOW_QUERY_COLLECTION].insert_one(entry)
+
+    def _plan_for(self, entry, command):
+        key = json.dumps(
+            [entry['database'], entry['collection'], entry['command'], entry['filter'], entry['sort']],
+            sort_keys=True
+        )
+        cached = self._plans.get(key)
+        now = time.monotonic()
+        if cached and now - cached[0] < self.app.config['SLOW_QUERY_EXPLAIN_INTERVAL']:
+            return cached[1], cached[2]
+
+        plan, error = None, None
+        inner = _explain_command(entry['command'], command, self.app.config['SLOW_QUERY_EXPLAIN_TIMEOUT_MS'])
+        if inner is not None:
+            try:
+                explain = mongo.cx[entry['database']].command(
+                    {'explain': inner, 'verbosity': 'executionStats'}
+                )
+                plan = summarize_explain(explain)
+            except PyMongoError as e:
+                error = str(e)
+        if len(self._plans) >= _MAX_CACHED_PLANS:
+            self._plans.clear()
+        self._plans[key] = (now, plan, error)
+        return plan, error
+
+
+def worst_routes(company_id, since, limit):
+    """Slow-log entries for a company grouped by route, most total time first.
+
+    Each row carries the count, total, average and maximum duration, how
+    many samples were collection scans, and the slowest sample in full.
+    """
+    pipeline = [
+        {'$match': {'company_id': company_id, 'ts': {'$gte': since}}},
+        {'$sort': {'duration_ms': -1}},
+        {'$group': {
+            '_id': {'route': '$route', 'method': '$method'},
+            'count': {'$sum': 1},
+            'total_ms': {'$sum': '$duration_ms'},
+            'avg_ms': {'$avg': '$duration_ms'},
+            'max_ms': {'$max': '$duration_ms'},
+            'collscans': {'$sum': {'$cond': [{'$eq': ['$plan.collscan', True]}, 1, 0]}},
+            'worst': {'$first': '$$ROOT'}
+        }},
+        {'$sort': {'total_ms': -1}},
+        {'$limit': limit}
+    ]
+    return list(mongo.db[SLOW_QUERY_COLLECTION].aggregate(pipeline))
+
+
+slow_queries = SlowQueryRecorder()
@@ -0,0 +1,232 @@
+import logging
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app import mongo
+from app.caching import RebuildConflict, scan_without_writes
+from app.currency import backfill_company_amounts, get_company_currency
+
+logger = logging.getLogger(__name__)
+
+# Per-company expense rollup kept in the expense_stats collection:
+#   {_id: company_id, currency, total_expenses, total_amount,
+#    by_status: {<status>: {count, total_amount}}, updated_at}
+# Amounts are in the company currency (each expense's amount_company).
+# Every expense write path adjusts it with a single atomic $inc, so the admin
+# stats endpoint is one document read. rebuild_company_stats repairs drift.
+# A missing rollup is built by the one caller whose insert of an empty,
+# ``rebuilding`` document succeeds; everyone else $incs that document. If
+# that build cannot finish, the placeholder is dropped so a later caller
+# builds it again.
+
+
+def _apply(company_id, inc):
+    update = {'$inc': inc, '$set': {'updated_at': datetime.utcnow()}}
+    result = mongo.db.expense_stats.update_one({'_id': company_id}, update)
+    if result.matched_count:
+        return
+    if _claim_rebuild(company_id):
+        # This call owns the first build, and the expenses it scans already include this write
+        try:
+            rebuild_company_stats(company_id)
+        except RebuildConflict as e:
+            _drop_claim(company_id)
+            logger.warning('Expense stats for company %s not built: %s', company_id, e)
+    else:
+        # Another request created the rollup first; count this write on it
+        mongo.db.expense_stats.update_one({'_id': company_id}, update)
+
+
+def _claim_rebuild(company_id):
+    """Create an empty, marked rollup; True for the one caller that created it."""
+    try:
+        mongo.db.expense_stats.insert_one({'_id': company_id, 'rebuilding': True, 'updated_at': datetime.utcnow()})
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def _drop_claim(company_id):
+    mongo.db.expense_stats.delete_one({'_id': company_id, 'rebuilding': True})
+
+
+def record_expense_created(company_id, amount, status, count=1):
+    """Count ``count`` new expenses totalling ``amount`` (company currency) in ``status``."""
+    _apply(company_id, {
+        'total_expenses': count,
+        'total_amount': amount,
+        f'by_status.{status}.count': count,
+        f'by_status.{status}.total_amount': amount
+    })
+
+
+def record_expense_deleted(company_id, amount, status):
+    _apply(company_id, {
+        'total_expenses': -1,
+        'total_amount': -amount,
+        f'by_status.{status}.count': -1,
+        f'by_status.{status}.total_amount': -amount
+    })
+
+
+def record_status_change(company_id, amount, old_status, new_status, count=1):
+    """Move ``count`` expenses totalling ``amount`` from one status to another."""
+    if old_status == new_status:
+        return
+    _apply(company_id, {
+        f'by_status.{old_status}.count': -count,
+        f'by_status.{old_status}.total_amount': -amount,
+        f'by_status.{new_status}.count': count,
+        f'by_status.{new_status}.total_amount': amount
+    })
+
+
+def record_amount_change(company_id, status, delta):
+    if not delta:
+        return
+    _apply(company_id, {
+        'total_amount': delta,
+        f'by_status.{status}.total_amount': delta
+    })
+
+
+def rebuild_company_stats(company_id):
+    """Recompute a company's rollup from the expenses collection and store it.
+
+    Expenses stored before ``amount_company`` existed are converted first, a
+    batch at a time, then counts and amounts per status come from one
+    server-side ``$group``, so no request holds the company's expenses.
+
+    The rollup is read alongside the scan and corrected by the difference
+    with ``$inc``, so writes after the scan add to the rebuilt values. A scan
+    that an expense write overlapped could count that write both in the
+    scan and in its own ``$inc``, so it is retried (see
+    ``scan_without_writes``); ``RebuildConflict`` is raised if writes never
+    pause.
+    """
+    backfill_company_amounts(company_id)
+
+    def scan():
+        before = mongo.db.expense_stats.find_one({'_id': company_id}) or {}
+        rows = mongo.db.expenses.aggregate([
+            {'$match': {'company_id': company_id}},
+            {'$group': {'_id': '$status', 'count': {'$sum': 1}, 'total_amount': {'$sum': '$amount_company'}}}
+        ])
+        return before, list(rows)
+
+    before, rows = scan_without_writes('expenses', company_id, scan)
+    by_status = {
+        str(row['_id']): {'count': row['count'], 'total_amount': round(row['total_amount'], 2)}
+        for row in rows
+    }
+    total_expenses = sum(values['count'] for values in by_status.values())
+    total_amount = round(sum(values['total_amount'] for values in by_status.values()), 2)
+
+    return _store_stats(company_id, before, total_expenses, total_amount, by_status)
+
+
+def _store_stats(company_id, before, total_expenses, total_amount, by_status):
+    inc = {
+        'total_expenses': total_expenses - before.get('total_expenses', 0),
+        'total_amount': total_amount - before.get('total_amount', 0)
+    }
+    old_by_status = before.get('by_status', {})
+    for status in set(by_status) | set(old_by_status):
+        new_values = by_status.get(status, {})
+        old_values = old_by_status.get(status, {})
+        inc[f'by_status.{status}.count'] = new_values.get('count', 0) - old_values.get('count', 0)
+        inc[f'by_status.{status}.total_amount'] = (
+            new_values.get('total_amount', 0) - old_values.get('total_amount', 0)
+        )
+
+    return mongo.db.expense_stats.find_one_and_update(
+        {'_id': company_id},
+        {
+            '$inc': inc,
+            '$set': {'currency': get_company_currency(company_id), 'updated_at': datetime.utcnow()},
+            '$unset': {'rebuilding': ''}
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def rebuild_all_stats():
+    """Rebuild the rollup for every company; returns the number rebuilt."""
+    company_ids = mongo.db.companies.distinct('_id')
+    for company_id in company_ids:
+        rebuild_company_stats(company_id)
+    return len(company_ids)
+
+
+def get_company_stats(company_id):
+    """Return a company's rollup, building it on first use."""
+    stats = mongo.db.expense_stats.find_one({'_id': company_id})
+    if stats is None and _claim_rebuild(company_id):
+        try:
+            return rebuild_company_stats(company_id)
+        except RebuildConflict:
+            _drop_claim(company_id)
+            raise
+    if stats is None:
+        # Another request is building it; serve what it holds so far
+        stats = mongo.db.expense_stats.find_one({'_id': company_id})
+    return stats
+
+
+def _amount_group(key):
+    return {'$group': {'_id': key, 'count': {'$sum': 1}, 'total_amount': {'$sum': '$amount'}}}
+
+
+def _dashboard_facets(top_spenders):
+    # One sub-pipeline per dashboard widget; all of them share a single scan
+    return {
+        'totals': [{'$group': {
+            '_id': None,
+            'count': {'$sum': 1},
+            'total_amount': {'$sum': '$amount'},
+            'unconverted': {'$sum': {'$cond': [{'$eq': ['$amount', None]}, 1, 0]}}
+        }}],
+        'by_status': [_amount_group('$status'), {'$sort': {'_id': 1}}],
+        'by_category': [_amount_group('$category'), {'$sort': {'total_amount': -1}}],
+        'top_spenders': [
+            _amount_group('$user_id'),
+            {'$sort': {'total_amount': -1, '_id': 1}},
+            {'$limit': top_spenders}
+        ],
+    }
+
+
+def compute_company_dashboard(company_id, top_spenders=5):
+    """Totals, status and category breakdowns and top spenders in one pass.
+
+    A single ``$facet`` pipeline runs over the company's expenses (matched on
+    the ``company_id`` index prefix), so adding a widget adds a facet rather
+    than another collection scan. Amounts are in company currency. Expenses
+    without ``amount_company`` (not yet backfilled) are counted but left out
+    of every amount rather than summed in their own currency; the result
+    reports how many there are as ``unconverted_expenses``.
+    """
+    pipeline = [
+        {'$match': {'company_id': company_id}},
+        {'$project': {
+            '_id': 0,
+            'status': 1,
+            'category': 1,
+            'user_id': 1,
+            'amount': {'$ifNull': ['$amount_company', None]}
+        }},
+        {'$facet': _dashboard_facets(top_spenders)}
+    ]
+    result = next(mongo.db.expenses.aggregate(pipeline), {})
+    totals = (result.get('totals') or [{}])[0]
+
+    return {
+        'currency': get_company_currency(company_id),
+        'total_expenses': totals.get('count', 0),
+        'total_amount': round(totals.get('total_amount', 0), 2),
+        'unconverted_expenses': totals.get('unconverted', 0),
+        'by_status': result.get('by_status', []),
+        'by_category': result.get('by_category', []),
+        'top_spenders': result.get('top_spenders', [])
+    }
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Benchmark API latency and throughput for the main expense flows.
+
+Seeds a company (admin, manager, employees and their expenses) through the
+API into a scratch database on a local mongod, then drives each scenario
+at every concurrency level through the Flask test client (in process, no
+sockets) and through a threaded werkzeug WSGI server over HTTP keep-alive
+connections. Prints a table to stderr and writes p50/p95/p99 latency and
+requests/sec per run as JSON, so runs can be diffed or plotted.
+
+The database named in --mongo-uri must contain "bench"; it is dropped
+before the run and afterwards (unless --keep).
+
+Usage: python benchmarks/bench_api.py [--mongo-uri mongodb://localhost:27017/expense_bench]
+       [--transports test-client,wsgi] [--concurrency 1,8,32] [--requests 200]
+       [--employees 20] [--expenses 50] [--scenarios login,submit,...] [--output results.json] [--keep]
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import MongoClient
+from pymongo.uri_parser import parse_uri
+
+CATEGORIES = ['Travel', 'Meals', 'Office Supplies', 'Software', 'Training']
+CURRENCIES = ['USD', 'EUR', 'GBP', 'INR']
+PASSWORD = 'bench-password'
+
+# Expenses per /expenses/submit-batch call while seeding (the route accepts up to 500)
+SEED_BATCH_SIZE = 200
+
+
+def parse_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    index = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+def random_expense(rng):
+    return {
+        'description': f"{rng.choice(['Taxi', 'Hotel', 'Lunch', 'Licence', 'Course', 'Flight'])} {rng.randint(1, 9999)}",
+        'category': rng.choice(CATEGORIES),
+        'amount': round(rng.uniform(5, 2000), 2),
+        'currency': rng.choice(CURRENCIES),
+        'expense_date': (date.today() - timedelta(days=rng.randint(0, 365))).isoformat(),
+        'paid_by': 'Employee',
+        'remarks': ''
+    }
+
+
+class TestClientTransport:
+    """Requests through Flask's test client, one client per thread."""
+
+    name = 'test-client'
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, token=None, body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = client.open(path, method=method, headers=headers, json=body)
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+class WSGITransport:
+    """Requests over HTTP to a threaded werkzeug server, one keep-alive connection per thread."""
+
+    name = 'wsgi'
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class KeepAliveHandler(WSGIRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=KeepAliveHandler)
+        self.port = self.server.server_port
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        return connection
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        payload = json.dumps(body).encode() if body is not None else None
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed the keep-alive connection; reconnect once
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+
+    def close(self):
+        self.server.shutdown()
+
+
+def call(transport, method, path, token=None, body=None, expected=(200,)):
+    status, data = transport.request(method, path, token, body)
+    if status not in expected:
+        raise RuntimeError(f"{method} {path} returned {status}: {data[:200]!r}")
+    return json.loads(data) if data else None
+
+
+class Dataset:
+    """The seeded company: tokens for every user and the manager's id."""
+
+    def __init__(self):
+        self.admin_token = None
+        self.manager_id = None
+        self.manager_token = None
+        self.employees = []  # [{'email', 'token'}]
+        self.expenses = 0
+
+
+def seed(transport, employees, expenses_per_employee, rng):
+    dataset = Dataset()
+    run_id = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+
+    signup = call(transport, 'POST', '/auth/signup', body={
+        'company_name': f'Bench {run_id}', 'email': f'admin-{run_id}@bench.local', 'password': PASSWORD
+    }, expected=(201,))
+    dataset.admin_token = signup['access_token']
+
+    manager = call(transport, 'POST', '/users/create', dataset.admin_token, {
+        'name': 'Bench Manager', 'email': f'manager-{run_id}@bench.local', 'password': PASSWORD, 'role': 'Manager'
+    }, expected=(201,))
+    dataset.manager_id = manager['user_id']
+    dataset.manager_token = call(transport, 'POST', '/auth/login', body={
+        'email': f'manager-{run_id}@bench.local', 'password': PASSWORD
+    })['access_token']
+
+    for i in range(employees):
+        email = f'employee{i}-{run_id}@bench.local'
+        call(transport, 'POST', '/users/create', dataset.admin_token, {
+            'name': f'Bench Employee {i:04d}', 'email': email, 'password': PASSWORD,
+            'role': 'Employee', 'manager_id': dataset.manager_id
+        }, expected=(201,))
+        token = call(transport, 'POST', '/auth/login', body={'email': email, 'password': PASSWORD})['access_token']
+        dataset.employees.append({'email': email, 'token': token})
+
+        remaining = expenses_per_employee
+        while remaining > 0:
+            batch = [random_expense(rng) for _ in range(min(remaining, SEED_BATCH_SIZE))]
+            call(transport, 'POST', '/expenses/submit-batch', token, {'expenses': batch}, expected=(201,))
+            remaining -= len(batch)
+            dataset.expenses += len(batch)
+    return dataset
+
+
+def pending_expense_ids(app, manager_id, limit):
+    """Expenses the manager can still approve, for the approve scenario."""
+    from bson import ObjectId
+    from app import mongo
+    with app.app_context():
+        cursor = mongo.db.expenses.find(
+            {'approver_id': ObjectId(manager_id), 'status': {'$in': ['submitted', 'pending']}},
+            {'_id': 1}
+        ).limit(limit)
+        return [str(expense['_id']) for expense in cursor]
+
+
+# Scenario name -> (expected statuses, request builder(dataset, i, rng, ids))
+SCENARIOS = {
+    'login': ((200,), lambda d, i, rng, ids: (
+        'POST', '/auth/login', None, {'email': d.employees[i % len(d.employees)]['email'], 'password': PASSWORD})),
+    'submit': ((201,), lambda d, i, rng, ids: (
+        'POST', '/expenses/submit', d.employees[i % len(d.employees)]['token'], random_expense(rng))),
+    'my-expenses': ((200,), lambda d, i, rng, ids: (
+        'GET', '/expenses/my-expenses', d.employees[i % len(d.employees)]['token'], None)),
+    'pending-approvals': ((200,), lambda d, i, rng, ids: (
+        'GET', '/expenses/pending-approvals', d.manager_token, None)),
+    'approve': ((200,), lambda d, i, rng, ids: (
+        'PUT', f'/expenses/approve/{ids[i]}', d.manager_token, {'action': 'approve', 'remarks': 'bench'})),
+    'all-expenses': ((200,), lambda d, i, rng, ids: (
+        'GET', '/expenses/all', d.admin_token, None)),
+    'stats': ((200,), lambda d, i, rng, ids: (
+        'GET', '/admin/expenses/stats', d.admin_token, None)),
+}
+
+
+def run_scenario(transport, name, dataset, requests, concurrency, app, rng):
+    expected, build = SCENARIOS[name]
+    ids = None
+    if name == 'approve':
+        # Each approval consumes one pending expense
+        ids = pending_expense_ids(app, dataset.manager_id, requests)
+        requests = len(ids)
+        if not requests:
+            return None
+    calls = [build(dataset, i, rng, ids) for i in range(requests)]
+    latencies = [0.0] * requests
+    statuses = [0] * requests
+
+    def one(i):
+        method, path, token, body = calls[i]
+        started = time.perf_counter()
+        try:
+            status, _ = transport.request(method, path, token, body)
+        except Exception:
+            status = 0
+        latencies[i] = time.perf_counter() - started
+        statuses[i] = status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        'transport': transport.name,
+        'scenario': name,
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': sum(1 for status in statuses if status not in expected),
+        'elapsed_s': round(elapsed, 4),
+        'rps': round(requests / elapsed, 2),
+        'latency_ms': {
+            'p50': round(percentile(ordered, 0.50) * 1000, 3),
+            'p95': round(percentile(ordered, 0.95) * 1000, 3),
+            'p99': round(percentile(ordered, 0.99) * 1000, 3),
+            'mean': round(sum(ordered) / requests * 1000, 3),
+            'max': round(ordered[-1] * 1000, 3)
+        }
+    }
+
+
+def warm_up(transport, dataset):
+    # First requests pay for imports, index lookups and connection set-up
+    for name in ('my-expenses', 'pending-approvals', 'all-expenses', 'stats'):
+        method, path, token, body = SCENARIOS[name][1](dataset, 0, None, None)
+        transport.request(method, path, token, body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/expense_bench')
+    parser.add_argument('--transports', type=parse_list, default=['test-client', 'wsgi'])
+    parser.add_argument('--concurrency', type=lambda value: [int(item) for item in parse_list(value)], default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and concurrency level')
+    parser.add_argument('--employees', type=int, default=20)
+    parser.add_argument('--expenses', type=int, default=50, help='Seeded expenses per employee')
+    parser.add_argument('--scenarios', type=parse_list, default=list(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='Write JSON here instead of stdout')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark database afterwards')
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    unknown = [name for name in args.transports if name not in ('test-client', 'wsgi')]
+    if unknown:
+        parser.error(f"Unknown transports: {', '.join(unknown)} (choose from test-client, wsgi)")
+    database = parse_uri(args.mongo_uri).get('database')
+    if not database or 'bench' not in database:
+        parser.error('--mongo-uri must name a scratch database containing "bench"; it is dropped')
+
+    # Configure the app before it is imported; .env values do not override these
+    os.environ['MONGO_URI'] = args.mongo_uri
+    os.environ.setdefault('JWT_SECRET_KEY', 'bench-jwt-secret')
+    os.environ.setdefault('SECRET_KEY', 'bench-secret')
+    os.environ['MAIL_OUTBOX_WORKERS'] = '0'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    started_at = datetime.utcnow().isoformat() + 'Z'
+    client = MongoClient(args.mongo_uri)
+    client.drop_database(database)
+
+    from app import create_app
+    app = create_app()
+    rng = random.Random(args.seed)
+
+    print(f"Seeding {args.employees} employees x {args.expenses} expenses into {database}...", file=sys.stderr)
+    started = time.perf_counter()
+    setup = TestClientTransport(app)
+    dataset = seed(setup, args.employees, args.expenses, rng)
+    print(f"Seeded {dataset.expenses} expenses in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+
+    results = []
+    print(f"{'transport':<12} {'scenario':<18} {'conc':>5} {'reqs':>6} {'err':>4} "
+          f"{'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}", file=sys.stderr)
+    try:
+        for transport_name in args.transports:
+            transport = TestClientTransport(app) if transport_name == 'test-client' else WSGITransport(app)
+            try:
+                warm_up(transport, dataset)
+                for concurrency in args.concurrency:
+                    for name in args.scenarios:
+                        result = run_scenario(transport, name, dataset, args.requests, concurrency, app, rng)
+                        if result is None:
+                            print(f"{transport.name:<12} {name:<18} {concurrency:>5} skipped: nothing left to approve",
+                                  file=sys.stderr)
+                            continue
+                        results.append(result)
+                        latency = result['latency_ms']
+                        print(f"{transport.name:<12} {name:<18} {concurrency:>5} {result['requests']:>6} "
+                              f"{result['errors']:>4} {result['rps']:>9.1f} {latency['p50']:>9.2f} "
+                              f"{latency['p95']:>9.2f} {latency['p99']:>9.2f}", file=sys.stderr)
+            finally:
+                transport.close()
+    finally:
+        if not args.keep:
+            client.drop_database(database)
+
+    report = {
+        'meta': {
+            'started_at': started_at,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'mongo_version': client.server_info().get('version'),
+            'employees': args.employees,
+            'expenses_per_employee': args.expenses,
+            'seeded_expenses': dataset.expenses,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'transports': args.transports,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"✅ Wrote {len(results)} results to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if any(result['errors'] for result in results):
+        print("❌ Some requests failed; see the errors column", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark password verification throughput (logins/sec) for each hash
+scheme, cost factor and process pool size, with concurrent request threads.
+
+Usage: python benchmarks/bench_hashing.py [--logins 200] [--threads 16]
+       [--scheme bcrypt] [--costs 10,12] [--workers 0,1,2,4]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.hashing import PasswordHasher
+
+
+def parse_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def run(hasher, logins, threads):
+    password_hash = hasher.hash('correct horse battery staple')
+    # Warm the pool so process start-up is not counted
+    hasher.verify('warmup', password_hash)
+
+    def login(_):
+        return hasher.verify('correct horse battery staple', password_hash)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(login, range(logins)))
+    elapsed = time.perf_counter() - started
+
+    if not all(results):
+        print("❌ A valid password failed to verify")
+        sys.exit(1)
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--scheme', default='bcrypt', choices=['bcrypt', 'pbkdf2'])
+    parser.add_argument('--costs', type=parse_list, default=[10, 12])
+    parser.add_argument('--workers', type=parse_list, default=[0, 1, 2, 4])
+    args = parser.parse_args()
+
+    print(f"{args.logins} logins from {args.threads} threads, scheme {args.scheme} (workers 0 = inline)")
+    print(f"{'cost':>8} {'workers':>8} {'logins/s':>10}")
+    for cost in args.costs:
+        for workers in args.workers:
+            hasher = PasswordHasher(scheme=args.scheme, cost=cost, workers=workers, timeout=600)
+            try:
+                rate = run(hasher, args.logins, args.threads)
+            finally:
+                hasher.shutdown()
+            print(f"{cost:>8} {workers:>8} {rate:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
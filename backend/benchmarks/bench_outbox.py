@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Benchmark mail delivery end to end: inline mail.send from request threads
+(one SMTP connection per message, the old behaviour) against the outbox,
+where requests call enqueue_mail and the dispatcher claims and delivers
+each message over reused connections.
+
+For each mode it reports how long the request thread waited per message,
+the delay until the message reached the server, and delivered messages per
+second. Runs against a minimal local SMTP server (no mail leaves the
+machine) and a scratch database on a local mongod; the database named in
+--mongo-uri must contain "bench" and is dropped before and after the run.
+
+Usage: python benchmarks/bench_outbox.py [--messages 500] [--threads 8] [--workers 2]
+       [--latency-ms 5] [--mongo-uri mongodb://localhost:27017/outbox_bench]
+"""
+
+import argparse
+import math
+import os
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask_mail import Message
+from pymongo.uri_parser import parse_uri
+from app import mail, mongo
+from app.indexes import INDEXES
+from app.outbox import enqueue_mail, outbox
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages from smtplib."""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        time.sleep(server.latency)  # Connection setup cost (TCP/TLS handshake on a real server)
+        self.reply('220 localhost bench')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.reply('250-localhost')
+                self.reply('250 OK')
+            elif command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with server.lock:
+                    server.received += 1
+                self.reply('250 OK')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply('250 OK')
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.received = 0
+
+
+def make_app(port, mongo_uri, workers):
+    app = Flask(__name__)
+    app.config.update(
+        MONGO_URI=mongo_uri,
+        MAIL_SERVER='127.0.0.1',
+        MAIL_PORT=port,
+        MAIL_USE_TLS=False,
+        MAIL_USE_SSL=False,
+        MAIL_DEFAULT_SENDER='bench@localhost',
+        MAIL_OUTBOX_WORKERS=workers
+    )
+    mongo.init_app(app)
+    mail.init_app(app)
+    outbox.init_app(app)
+    return app
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    index = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+def summarize(label, waits, delays, elapsed):
+    waits, delays = sorted(waits), sorted(delays)
+    print(f"{label:<10} {len(delays) / elapsed:10.1f} msg/s"
+          f" | request wait p50 {percentile(waits, 0.5) * 1000:8.2f} p99 {percentile(waits, 0.99) * 1000:8.2f} ms"
+          f" | delivered after p50 {percentile(delays, 0.5) * 1000:8.1f}"
+          f" p95 {percentile(delays, 0.95) * 1000:8.1f} p99 {percentile(delays, 0.99) * 1000:8.1f} ms")
+
+
+def run_inline(app, server, messages, threads):
+    """Each request thread sends its own message over a new connection."""
+    server.received = 0
+    waits = [0.0] * messages
+
+    def send(i):
+        started = time.perf_counter()
+        with app.app_context():
+            mail.send(Message(f'Benchmark {i}', recipients=[f'user{i}@localhost'], body='Password: x' * 10))
+        waits[i] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(send, range(messages)))
+    elapsed = time.perf_counter() - started
+    # The message is delivered when the request thread returns
+    summarize('inline', waits, waits, elapsed)
+    return server.received
+
+
+def run_outbox(app, server, messages, threads, timeout):
+    """Request threads enqueue; the outbox claims and delivers in the background."""
+    server.received = 0
+    waits = [0.0] * messages
+    enqueued_at = {}
+
+    def enqueue(i):
+        started = time.perf_counter()
+        with app.app_context():
+            message_id = enqueue_mail(f'Benchmark {i}', [f'user{i}@localhost'], 'Password: x' * 10)
+        waits[i] = time.perf_counter() - started
+        enqueued_at[message_id] = time.perf_counter()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(enqueue, range(messages)))
+
+    # Poll for delivery; the first time a message shows as sent is its delivery time
+    delays = []
+    pending = set(enqueued_at)
+    deadline = started + timeout
+    with app.app_context():
+        while pending and time.perf_counter() < deadline:
+            sent = mongo.db.mail_outbox.find({'_id': {'$in': list(pending)}, 'status': 'sent'}, {'_id': 1})
+            now = time.perf_counter()
+            for doc in sent:
+                pending.discard(doc['_id'])
+                delays.append(now - enqueued_at[doc['_id']])
+            if pending:
+                time.sleep(0.005)
+    elapsed = time.perf_counter() - started
+
+    if delays:
+        summarize('outbox', waits, delays, elapsed)
+    return server.received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent request threads sending mail')
+    parser.add_argument('--workers', type=int, default=2, help='Outbox sender threads')
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=120.0, help='Seconds to wait for outbox delivery')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/outbox_bench')
+    args = parser.parse_args()
+
+    database = parse_uri(args.mongo_uri).get('database')
+    if not database or 'bench' not in database:
+        parser.error('--mongo-uri must name a scratch database containing "bench"; it is dropped')
+
+    server = SMTPServer(args.latency_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app = make_app(server.server_address[1], args.mongo_uri, args.workers)
+
+    with app.app_context():
+        mongo.cx.drop_database(database)
+        mongo.db.mail_outbox.create_indexes(INDEXES['mail_outbox'])
+
+    print(f"Sending {args.messages} messages from {args.threads} request threads "
+          f"({args.workers} outbox senders, {args.latency_ms} ms connection set-up)...")
+    try:
+        inline_count = run_inline(app, server, args.messages, args.threads)
+        outbox_count = run_outbox(app, server, args.messages, args.threads, args.timeout)
+    finally:
+        outbox.stop()
+        server.shutdown()
+        with app.app_context():
+            mongo.cx.drop_database(database)
+
+    if inline_count != args.messages or outbox_count != args.messages:
+        print(f"❌ Server received {inline_count} and {outbox_count} of {args.messages} messages")
+        sys.exit(1)
+
+    print("✅ All messages delivered")
+
+
+if __name__ == '__main__':
+    main()
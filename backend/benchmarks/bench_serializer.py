@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark expense serialization: the old per-field isinstance/strftime code
+from get_all_expenses against the compiled field plan in app.serializers.
+
+Usage: python benchmarks/bench_serializer.py [--rows 100000]
+"""
+
+import argparse
+import copy
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from app.serializers import get_serializer
+
+
+def make_documents(rows):
+    company_id = ObjectId()
+    users = [ObjectId() for _ in range(50)]
+    start = datetime(2024, 1, 1, 9, 30)
+    documents = []
+    for i in range(rows):
+        documents.append({
+            '_id': ObjectId(),
+            'company_id': company_id,
+            'user_id': users[i % len(users)],
+            'description': f'Expense {i}',
+            'category': 'Travel',
+            'amount': 100.0 + i % 500,
+            'currency': 'USD',
+            'expense_date': start + timedelta(days=i % 365),
+            'paid_by': 'Company Card',
+            'remarks': '',
+            'status': 'approved' if i % 3 else 'submitted',
+            'approver_id': users[(i + 1) % len(users)],
+            'submitted_at': start + timedelta(minutes=i),
+            'approved_at': start + timedelta(minutes=i + 60) if i % 3 else None,
+            'approval_remarks': ''
+        })
+    return documents
+
+
+def legacy_serialize(expense):
+    """Conversion code previously inlined in get_all_expenses"""
+    expense['_id'] = str(expense['_id'])
+    expense['user_id'] = str(expense['user_id'])
+    if expense.get('approver_id'):
+        expense['approver_id'] = str(expense['approver_id'])
+    if expense.get('company_id'):
+        expense['company_id'] = str(expense['company_id'])
+    if expense.get('expense_date'):
+        if isinstance(expense['expense_date'], str):
+            expense['expense_date'] = expense['expense_date']
+        else:
+            expense['expense_date'] = expense['expense_date'].strftime('%Y-%m-%d')
+    if expense.get('submitted_at'):
+        if isinstance(expense['submitted_at'], str):
+            expense['submitted_at'] = expense['submitted_at']
+        else:
+            expense['submitted_at'] = expense['submitted_at'].strftime('%Y-%m-%d %H:%M')
+    if expense.get('approved_at'):
+        if isinstance(expense['approved_at'], str):
+            expense['approved_at'] = expense['approved_at']
+        else:
+            expense['approved_at'] = expense['approved_at'].strftime('%Y-%m-%d %H:%M')
+    return expense
+
+
+def run(label, serialize, documents):
+    documents = copy.deepcopy(documents)
+    started = time.perf_counter()
+    for expense in documents:
+        serialize(expense)
+    elapsed = time.perf_counter() - started
+    per_row_us = elapsed / len(documents) * 1e6
+    print(f"{label:<12} {elapsed * 1000:10.1f} ms total {per_row_us:8.3f} us/row")
+    return documents, per_row_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"Serializing {args.rows} expense documents...")
+    documents = make_documents(args.rows)
+
+    legacy_rows, legacy_us = run('legacy', legacy_serialize, documents)
+    compiled_rows, compiled_us = run('compiled', get_serializer(), documents)
+
+    if legacy_rows != compiled_rows:
+        print("❌ Compiled serializer output differs from legacy output")
+        sys.exit(1)
+
+    print(f"✅ Outputs match, speedup {legacy_us / compiled_us:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 from app import create_app
 
-app = create_app()
-
+# Password hashing workers are spawned processes that re-import this module,
+# so the app is only built when it is run directly. WSGI servers and the
+# flask CLI use the factory instead: gunicorn 'app:create_app()' or
+# flask --app app run.
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app = create_app()
+    app.run(debug=True, host='0.0.0.0', port=5000)
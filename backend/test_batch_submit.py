@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test script for /expenses/submit-batch partial success handling
+"""
+
+import requests
+
+# Base URL for the API
+BASE_URL = "http://localhost:5000"
+
+
+def test_batch_submit():
+    print("🧪 Testing batch expense submission...")
+
+    employee_login = {
+        "email": "employee@test.com",
+        "password": "testpass123"
+    }
+
+    batch = {
+        "expenses": [
+            {
+                "description": "Flight to client site",
+                "category": "Travel",
+                "amount": 420.00,
+                "currency": "USD",
+                "expense_date": "2024-03-04",
+                "paid_by": "Company Card",
+                "remarks": "Trip day 1"
+            },
+            {
+                "description": "Hotel",
+                "category": "Travel",
+                "amount": 180.00,
+                "currency": "USD",
+                "expense_date": "2024-03-04",
+                "paid_by": "Personal"
+            },
+            {
+                # Invalid: negative amount
+                "description": "Taxi",
+                "category": "Travel",
+                "amount": -12,
+                "currency": "USD",
+                "expense_date": "2024-03-05",
+                "paid_by": "Cash"
+            }
+        ]
+    }
+
+    try:
+        # 1. Login as employee
+        print("\n1. Logging in as employee...")
+        login_response = requests.post(f"{BASE_URL}/auth/login", json=employee_login)
+        if login_response.status_code != 200:
+            print(f"❌ Employee login failed: {login_response.text}")
+            return
+
+        headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+        print("✅ Employee logged in")
+
+        # 2. Submit a batch with one invalid item
+        print("\n2. Submitting a batch of 3 expenses (1 invalid)...")
+        response = requests.post(f"{BASE_URL}/expenses/submit-batch", json=batch, headers=headers)
+        print(f"Status Code: {response.status_code}")
+        data = response.json()
+
+        if response.status_code == 207 and data.get('submitted') == 2 and data.get('failed') == 1:
+            print("✅ Partial success reported")
+        else:
+            print(f"❌ Unexpected response: {data}")
+            return
+
+        # 3. Results are reported per item, in request order
+        for result in data['results']:
+            if 'expense_id' in result:
+                print(f"✅ Item {result['index']} stored as {result['expense_id']}")
+            else:
+                print(f"✅ Item {result['index']} rejected: {result['error']}")
+
+        print("\n🎉 Batch submission test completed!")
+
+    except requests.exceptions.ConnectionError:
+        print("❌ Could not connect to the server. Make sure the Flask app is running on localhost:5000")
+    except Exception as e:
+        print(f"❌ Test failed with error: {str(e)}")
+
+
+if __name__ == "__main__":
+    test_batch_submit()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test script for cursor pagination on /expenses/all and /expenses/my-expenses
+"""
+
+import requests
+
+# Base URL for the API
+BASE_URL = "http://localhost:5000"
+
+
+def fetch_all_pages(url, headers, limit):
+    """Follow next_cursor until the last page and return every row"""
+    rows = []
+    pages = 0
+    cursor = None
+    while True:
+        params = {'limit': limit}
+        if cursor:
+            params['cursor'] = cursor
+        response = requests.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            print(f"❌ Page request failed: {response.text}")
+            return None, pages
+        data = response.json()
+        rows.extend(data['expenses'])
+        pages += 1
+        cursor = data.get('next_cursor')
+        if not cursor:
+            return rows, pages
+
+
+def test_pagination():
+    print("🧪 Testing cursor pagination...")
+
+    admin_login = {
+        "email": "admin@test.com",
+        "password": "testpass123"
+    }
+
+    try:
+        # 1. Login as admin
+        print("\n1. Logging in as admin...")
+        login_response = requests.post(f"{BASE_URL}/auth/login", json=admin_login)
+        if login_response.status_code != 200:
+            print(f"❌ Admin login failed: {login_response.text}")
+            return
+
+        headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+        print("✅ Admin logged in")
+
+        # 2. Page through all company expenses two at a time
+        print("\n2. Paging through /expenses/all with limit=2...")
+        rows, pages = fetch_all_pages(f"{BASE_URL}/expenses/all", headers, 2)
+        if rows is None:
+            return
+        print(f"✅ Fetched {len(rows)} expenses in {pages} pages")
+
+        # 3. No expense should appear on two pages
+        ids = [row['_id'] for row in rows]
+        if len(ids) == len(set(ids)):
+            print("✅ No duplicates across pages")
+        else:
+            print("❌ Duplicate expenses found across pages")
+
+        # 4. Pages must be ordered newest first
+        submitted = [row['submitted_at'] for row in rows]
+        if submitted == sorted(submitted, reverse=True):
+            print("✅ Expenses ordered by submitted_at descending")
+        else:
+            print("❌ Expenses are not ordered by submitted_at")
+
+        # 5. A tampered cursor must be rejected
+        print("\n5. Sending an invalid cursor...")
+        response = requests.get(f"{BASE_URL}/expenses/all", headers=headers, params={'cursor': 'not-a-cursor'})
+        if response.status_code == 400:
+            print("✅ Invalid cursor rejected")
+        else:
+            print(f"❌ Expected 400, got {response.status_code}")
+
+        print("\n🎉 Pagination test completed!")
+
+    except requests.exceptions.ConnectionError:
+        print("❌ Could not connect to the server. Make sure the Flask app is running on localhost:5000")
+    except Exception as e:
+        print(f"❌ Test failed with error: {str(e)}")
+
+
+if __name__ == "__main__":
+    test_pagination()
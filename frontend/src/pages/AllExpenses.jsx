@@ -10,6 +10,10 @@ const AllExpenses = () => {
   const [error, setError] = useState('');
   const [filter, setFilter] = useState('all');
   const [searchTerm, setSearchTerm] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [searchResults, setSearchResults] = useState(null);
+  const [facets, setFacets] = useState(null);
 
   const { user } = useAuth();
 
@@ -27,14 +31,38 @@ const AllExpenses = () => {
 
   useEffect(() => {
     fetchExpenses();
-  }, []);
+  }, [filter]);
+
+  // Status filtering happens on the server so only matching rows are transferred
+  const listParams = () => (filter === 'all' ? {} : { status: filter });
+
+  // Search the whole company on the server once the user pauses typing
+  useEffect(() => {
+    const term = searchTerm.trim();
+    if (term.length < 2) {
+      setSearchResults(null);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await expenseAPI.search({ q: term });
+        setSearchResults(response.data.expenses || []);
+      } catch (error) {
+        // Fall back to filtering the loaded expenses
+        setSearchResults(null);
+      }
+    }, 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
 
   const fetchExpenses = async () => {
     try {
       console.log('Fetching all expenses...');
-      const response = await expenseAPI.getAll();
+      const response = await expenseAPI.getAll({ ...listParams(), facets: 1 });
       console.log('Expenses response:', response.data);
       setExpenses(response.data.expenses || []);
+      setNextCursor(response.data.next_cursor || null);
+      setFacets(response.data.facets || null);
     } catch (error) {
       console.error('Error fetching expenses:', error);
       setError('Failed to fetch expenses: ' + (error.response?.data?.error || error.message));
@@ -43,6 +71,20 @@ const AllExpenses = () => {
     }
   };
 
+  const loadMoreExpenses = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await expenseAPI.getAll({ ...listParams(), cursor: nextCursor });
+      setExpenses((prev) => [...prev, ...(response.data.expenses || [])]);
+      setNextCursor(response.data.next_cursor || null);
+    } catch (error) {
+      setError('Failed to fetch expenses: ' + (error.response?.data?.error || error.message));
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const getStatusBadge = (status) => {
     // Handle undefined, null, or empty status
     const safeStatus = status || 'pending';
@@ -61,8 +103,9 @@ const AllExpenses = () => {
     );
   };
 
-  const filteredExpenses = expenses.filter(expense => {
+  const filteredExpenses = (searchResults ?? expenses).filter(expense => {
     const matchesFilter = filter === 'all' || (expense.status || 'pending') === filter;
+    if (searchResults) return matchesFilter;
     const searchLower = searchTerm.toLowerCase();
     const matchesSearch = (expense.description || '').toLowerCase().includes(searchLower) ||
                          (expense.employee_name || '').toLowerCase().includes(searchLower) ||
@@ -70,7 +113,23 @@ const AllExpenses = () => {
     return matchesFilter && matchesSearch;
   });
 
-  const totalAmount = filteredExpenses.reduce((sum, expense) => sum + (expense.amount || 0), 0);
+  // Counts and amounts come from one source: the server facets for the whole
+  // filtered list, or the rows on screen while searching or before facets load
+  const useFacets = facets && !searchResults && !searchTerm.trim();
+  const statusSummary = (status) => {
+    if (useFacets) {
+      const facet = facets.status?.find(f => f.value === status);
+      return { count: facet?.count || 0, amount: facet?.total_amount || 0 };
+    }
+    const rows = filteredExpenses.filter(e => (e.status || 'pending') === status);
+    return { count: rows.length, amount: rows.reduce((sum, e) => sum + (e.amount || 0), 0) };
+  };
+
+  const totalAmount = useFacets
+    ? (facets.status || [])
+        .filter(f => filter === 'all' || f.value === filter)
+        .reduce((sum, f) => sum + (f.total_amount || 0), 0)
+    : filteredExpenses.reduce((sum, expense) => sum + (expense.amount || 0), 0);
 
   if (loading) {
     return (
@@ -150,8 +209,8 @@ const AllExpenses = () => {
         {/* Summary Cards */}
         <div className="grid grid-cols-1 md:grid-cols-4 gap-6 mb-6">
           {['submitted', 'pending', 'approved', 'rejected'].map(status => {
-            const count = expenses.filter(e => e.status === status).length;
-            const amount = expenses.filter(e => e.status === status).reduce((sum, e) => sum + e.amount, 0);
+            // Facets cover every matching expense, not just the loaded pages
+            const { count, amount } = statusSummary(status);
             
             return (
               <div key={status} className="bg-white overflow-hidden shadow rounded-lg">
@@ -235,6 +294,17 @@ const AllExpenses = () => {
                 </tbody>
               </table>
             </div>
+            {nextCursor && (
+              <div className="px-6 py-4 border-t border-gray-200 text-center">
+                <button
+                  onClick={loadMoreExpenses}
+                  disabled={loadingMore}
+                  className="px-4 py-2 text-sm font-medium text-blue-600 hover:text-blue-800 disabled:opacity-50"
+                >
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </button>
+              </div>
+            )}
           </div>
         </div>
 
@@ -8,6 +8,8 @@ const MyExpenses = () => {
   const [expenses, setExpenses] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchExpenses();
@@ -17,6 +19,7 @@ const MyExpenses = () => {
     try {
       const response = await expenseAPI.getMyExpenses();
       setExpenses(response.data.expenses);
+      setNextCursor(response.data.next_cursor || null);
     } catch (error) {
       setError(error.response?.data?.error || 'Failed to fetch expenses');
     } finally {
@@ -24,6 +27,20 @@ const MyExpenses = () => {
     }
   };
 
+  const loadMoreExpenses = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await expenseAPI.getMyExpenses({ cursor: nextCursor });
+      setExpenses((prev) => [...prev, ...response.data.expenses]);
+      setNextCursor(response.data.next_cursor || null);
+    } catch (error) {
+      setError(error.response?.data?.error || 'Failed to fetch expenses');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const getStatusBadge = (status) => {
     const statusClasses = {
       submitted: 'bg-yellow-100 text-yellow-800',
@@ -132,6 +149,17 @@ const MyExpenses = () => {
               ))}
             </ul>
           )}
+          {nextCursor && (
+            <div className="px-4 py-4 sm:px-6 border-t border-gray-200 text-center">
+              <button
+                onClick={loadMoreExpenses}
+                disabled={loadingMore}
+                className="px-4 py-2 text-sm font-medium text-blue-600 hover:text-blue-800 disabled:opacity-50"
+              >
+                {loadingMore ? 'Loading...' : 'Load more'}
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </div>
@@ -10,6 +10,8 @@ const UserManagement = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [showCreateModal, setShowCreateModal] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [searchTerm, setSearchTerm] = useState('');
 
   const { user } = useAuth();
 
@@ -26,14 +28,22 @@ const UserManagement = () => {
   }
 
   useEffect(() => {
-    fetchUsers();
     fetchManagers();
   }, []);
 
+  // Reload the first page whenever the name/email prefix changes
+  useEffect(() => {
+    const timer = setTimeout(fetchUsers, 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  const listParams = () => (searchTerm.trim() ? { q: searchTerm.trim() } : {});
+
   const fetchUsers = async () => {
     try {
-      const response = await userAPI.list();
+      const response = await userAPI.list(listParams());
       setUsers(response.data.users);
+      setNextCursor(response.data.next_cursor || null);
     } catch (error) {
       setError('Failed to fetch users');
       console.error(error);
@@ -42,6 +52,18 @@ const UserManagement = () => {
     }
   };
 
+  const loadMoreUsers = async () => {
+    if (!nextCursor) return;
+    try {
+      const response = await userAPI.list({ ...listParams(), cursor: nextCursor });
+      setUsers((prev) => [...prev, ...response.data.users]);
+      setNextCursor(response.data.next_cursor || null);
+    } catch (error) {
+      setError('Failed to fetch users');
+      console.error(error);
+    }
+  };
+
   const fetchManagers = async () => {
     try {
       const response = await userAPI.getManagers();
@@ -128,6 +150,13 @@ const UserManagement = () => {
             <p className="mt-1 max-w-2xl text-sm text-gray-500">
               Manage roles and reporting structure for your team.
             </p>
+            <input
+              type="text"
+              placeholder="Search by name or email..."
+              className="mt-4 w-full sm:w-80 border border-gray-300 rounded-md px-3 py-2 focus:outline-none focus:ring-2 focus:ring-primary"
+              value={searchTerm}
+              onChange={(e) => setSearchTerm(e.target.value)}
+            />
           </div>
           <div className="border-t border-gray-200">
             <div className="overflow-x-auto">
@@ -195,6 +224,16 @@ const UserManagement = () => {
                 </tbody>
               </table>
             </div>
+            {nextCursor && (
+              <div className="px-6 py-4 border-t border-gray-200 text-center">
+                <button
+                  onClick={loadMoreUsers}
+                  className="px-4 py-2 text-sm font-medium text-blue-600 hover:text-blue-800"
+                >
+                  Load more
+                </button>
+              </div>
+            )}
           </div>
         </div>
       </div>
@@ -41,7 +41,7 @@ export const authAPI = {
 
 // User APIs
 export const userAPI = {
-  list: () => api.get('/users/list'),
+  list: (params) => api.get('/users/list', { params }),
   create: (data) => api.post('/users/create', data),
   updateRole: (data) => api.put('/users/update-role', data),
   assignManager: (data) => api.put('/users/assign-manager', data),
@@ -52,10 +52,14 @@ export const userAPI = {
 // Expense APIs
 export const expenseAPI = {
   submit: (data) => api.post('/expenses/submit', data),
-  getMyExpenses: () => api.get('/expenses/my-expenses'),
+  submitBatch: (data) => api.post('/expenses/submit-batch', data),
+  getMyExpenses: (params) => api.get('/expenses/my-expenses', { params }),
   getPendingApprovals: () => api.get('/expenses/pending-approvals'),
   approve: (expenseId, data) => api.put(`/expenses/approve/${expenseId}`, data),
-  getAll: () => api.get('/expenses/all'),
+  approveBulk: (data) => api.put('/expenses/approve-bulk', data),
+  getAll: (params) => api.get('/expenses/all', { params }),
+  search: (params) => api.get('/expenses/search', { params }),
+  getTeam: (params) => api.get('/expenses/team', { params }),
   getCategories: () => api.get('/expenses/categories'),
   getCurrencies: () => api.get('/expenses/currencies'),
   getPaymentMethods: () => api.get('/expenses/payment-methods'),
@@ -66,6 +70,9 @@ export const adminAPI = {
   setApprovalChain: (data) => api.post('/admin/approval-chain', data),
   getApprovalChain: () => api.get('/admin/approval-chain'),
   getExpenseStats: () => api.get('/admin/expenses/stats'),
+  getExpenseDashboard: (params) => api.get('/admin/expenses/dashboard', { params }),
+  getSpendAnalytics: (params) => api.get('/admin/analytics/spend', { params }),
+  getSlowQueries: (params) => api.get('/admin/slow-queries', { params }),
 };
 
 export default api;
\ No newline at end of file